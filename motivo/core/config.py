@@ -75,6 +75,9 @@ class Config:
         self.default_video_quality = os.getenv("MOTIVO_VIDEO_QUALITY", "low")
         self.video_qualities = ["low", "medium", "high", "hd"]
         
+        # Offload WebRTC frame resize/color conversion to OpenCL (needs a working driver)
+        self.webrtc_use_opencl = os.getenv("MOTIVO_WEBRTC_OPENCL", "0") == "1"
+        
     @property
     def ws_url(self):
         return f"ws://{self.backend_domain}:{self.ws_port}"
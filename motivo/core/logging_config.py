@@ -1,8 +1,21 @@
+import atexit
 import logging
+import logging.handlers
+import queue
 import sys
 
+# Background thread that writes queued log records to the console
+_listener = None
+
 def setup_logging(debug=False):
-    """Configure logging for the application"""
+    """
+    Configure logging for the application.
+    
+    Records are handed to a QueueHandler and written to stdout by a
+    QueueListener thread, so logging from the event loop never blocks on
+    console I/O.
+    """
+    global _listener
     level = logging.DEBUG if debug else logging.INFO
     
     # Configure root logger
@@ -24,8 +37,15 @@ def setup_logging(debug=False):
     )
     console.setFormatter(formatter)
     
-    # Add handler to logger
-    logger.addHandler(console)
+    # Write through a queue so callers only enqueue the record
+    if _listener is not None:
+        atexit.unregister(_listener.stop)
+        _listener.stop()
+    log_queue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(log_queue, console, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     
     # Create specific loggers
     create_logger('network', level)
@@ -6,10 +6,10 @@ import logging
 import numpy as np
 import torch
 from datetime import datetime
-import json
 
 from core.config import config
 from core.state import app_state
+from network.ws_manager import CachedMessage
 from utils.smpl_utils import qpos_to_smpl
 from utils.frame_utils import save_frame_data, save_shared_frame
 from utils.utils import normalize_q_value
@@ -17,6 +17,10 @@ from rewards.reward_context import compute_q_value
 
 logger = logging.getLogger('simulation')
 
+# Decimals kept for floats in the JSON pose update - well below what the SMPL
+# viewer can show, and roughly halves the payload versus full float64 repr
+POSE_DECIMALS = 5
+
 async def run_simulation_loop():
     """Run the continuous simulation loop"""
     if not app_state.is_initialized:
@@ -192,19 +196,25 @@ async def broadcast_pose_update(q_percentage, frame_count: int):
         # Prepare pose data for broadcast
         pose_data = {
             "type": "smpl_update",
-            "pose": pose.tolist(),
-            "trans": trans.tolist(),
-            "positions": [pos.tolist() for pos in positions],
-            "qpos": qpos.tolist(),
+            "pose": np.round(pose, POSE_DECIMALS).tolist(),
+            "trans": np.round(trans, POSE_DECIMALS).tolist(),
+            "positions": [np.round(pos, POSE_DECIMALS).tolist() for pos in positions],
+            "qpos": np.round(qpos, POSE_DECIMALS).tolist(),
             "timestamp": datetime.now().isoformat(),
             "position_names": position_names,
             "cache_file": str(cache_file) if cache_file else None
         }
 
-        # Serialize ONCE before the loop
+        # Serialize ONCE; the manager reuses this encoding for every client.
+        # Binary (MessagePack) clients get the rotvecs as raw float16 - plenty
+        # for angles in [-pi, pi] and a quarter of the float64 size.
+        pose_message = CachedMessage(pose_data, binary_overrides={
+            "pose": np.asarray(pose, dtype=np.float16).tobytes(),
+            "pose_dtype": "float16"
+        })
         try:
-             payload_json = json.dumps(pose_data)
-             payload_size = len(payload_json)
+             # Pose frames are small enough to encode inline; only huge payloads are offloaded
+             payload_size = len(await pose_message.encode_off_loop())
              # Log periodically or if size exceeds a threshold to avoid spam
              if frame_count % 60 == 0: # Log every 60 frames (use passed frame_count)
                   logger.debug(f"Broadcasting pose_data payload size: {payload_size} bytes")
@@ -222,39 +232,9 @@ async def broadcast_pose_update(q_percentage, frame_count: int):
         if not connected_clients:
             return # No clients, nothing to do
 
-        # Define the sending task coroutine function
-        async def send_to_client(ws, data_json):
-            import websockets # Ensure websockets is available in this scope
-            try:
-                await ws.send(data_json)
-            except websockets.exceptions.ConnectionClosedOK:
-                logger.debug(f"Client {ws.remote_address} disconnected normally during send.")
-                # Optionally remove client here if manager doesn't handle it automatically
-                # app_state.ws_manager.connected_clients.discard(ws)
-            except websockets.exceptions.ConnectionClosedError as e:
-                logger.warning(f"Client {ws.remote_address} connection closed unexpectedly during send: {e}")
-                # Optionally remove client here
-                # app_state.ws_manager.connected_clients.discard(ws)
-            except Exception as send_error:
-                # Log other send errors without crashing the simulation
-                logger.error(f"Error sending pose update to client {getattr(ws, 'remote_address', 'unknown')}: {send_error}")
-
-        # Create a send task for each client without awaiting
-        tasks = []
-        for ws in list(connected_clients): # Iterate over a copy in case the set is modified
-             tasks.append(asyncio.create_task(send_to_client(ws, payload_json)))
-
-        # Optionally, gather tasks with a very short timeout if you need minimal waiting,
-        # but the primary goal is to not block the main loop.
-        # For true fire-and-forget, just creating the tasks is enough.
-        # If gathering, handle potential exceptions from the tasks.
-        # Example (optional):
-        # done, pending = await asyncio.wait(tasks, timeout=0.01) # Very short timeout
-        # for task in pending:
-        #     task.cancel() # Cancel tasks that didn't complete quickly
-        # for task in done:
-        #     if task.exception():
-        #         logger.error(f"Error in broadcast send task: {task.exception()}")
+        # Fan out the pre-serialized payload; the manager queues it per client
+        # and never waits on a slow one
+        await app_state.ws_manager.broadcast(pose_message)
 
     except Exception as e:
         # Catch errors in pose data preparation or client iteration
@@ -302,7 +282,7 @@ async def cleanup_stale_connections():
     if stale_connections:
         if hasattr(app_state.ws_manager, 'connected_clients'):
             for ws in stale_connections:
-                app_state.ws_manager.connected_clients.discard(ws)
+                app_state.ws_manager.remove_client(ws)
                 removed_count += 1
             logger.info(f"Removed {removed_count} stale connections, {len(app_state.ws_manager.connected_clients)} remaining")
         else:
@@ -337,9 +317,8 @@ async def render_and_process_frame(frame_count, q_percentage, last_frame_save_ti
             is_computing=app_state.message_handler.is_computing_reward
         )
         
-        # Make a copy for WebRTC to avoid any potential memory issues
-        frame_copy = frame_with_overlays.copy()
-        
+        # No copy needed for WebRTC: show_frame returns a fresh array each call and the
+        # track transformers write into their own output buffers
         # PRIORITY 1: Update WebRTC stream ASAP - this is the most time-sensitive task
         webrtc_updated = False
         webrtc_connections = 0
@@ -351,7 +330,7 @@ async def render_and_process_frame(frame_count, q_percentage, last_frame_save_ti
                 
                 if webrtc_connections > 0:
                     # Don't use a timeout here to ensure the frame gets through
-                    result = await app_state.webrtc_manager.broadcast_frame(frame_copy)
+                    result = await app_state.webrtc_manager.broadcast_frame(frame_with_overlays)
                     webrtc_updated = result > 0
                     
                     # Measure and log WebRTC frame processing time periodically
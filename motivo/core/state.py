@@ -28,7 +28,10 @@ class AppState:
         # Support services
         self.thread_pool = ThreadPoolExecutor(max_workers=2)
         self.ws_manager = WebSocketManager()
-        self.webrtc_manager = WebRTCManager(video_quality=config.default_video_quality)
+        self.webrtc_manager = WebRTCManager(
+            video_quality=config.default_video_quality,
+            use_opencl=config.webrtc_use_opencl
+        )
         self.display_manager = DisplayManager(headless=config.in_container)
         
         # Will initialize after model/env are loaded
@@ -12,7 +12,7 @@ import traceback
 import atexit
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Union
 import concurrent.futures
 import time
 import re
@@ -257,10 +257,11 @@ class MessageHandler:
              # Return the computed z regardless of whether self.current_z was updated
              return computed_z
 
-    async def handle_message(self, websocket, message: str) -> None:
+    async def handle_message(self, websocket, message: Union[str, bytes, Dict[str, Any]]) -> None:
         """Main message handler that routes to specific command handlers"""
         try:
-            data = json.loads(message)
+            # Accept raw JSON or a message the connection handler already decoded
+            data = message if isinstance(message, dict) else json.loads(message)
             message_type = data.get("type", "")
             
             # Log message type unless it's debug_model_info
@@ -5,6 +5,11 @@ import torch
 from asyncio.exceptions import CancelledError
 import traceback
 
+try:
+    import uvloop
+except ImportError:  # optional - the stock asyncio loop works, just slower
+    uvloop = None
+
 from core.config import config
 from core.state import app_state
 from core.model_manager import initialize_model_and_env
@@ -135,4 +140,6 @@ async def main():
         logger.info("Shutdown complete")
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        uvloop.install()
     asyncio.run(main())
\ No newline at end of file
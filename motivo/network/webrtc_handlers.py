@@ -4,6 +4,7 @@ import json
 import traceback
 
 from core.state import app_state
+from network.webrtc_manager import parse_ice_candidate
 
 logger = logging.getLogger('webrtc')
 
@@ -101,14 +102,27 @@ async def handle_ice_candidate(websocket, data):
     logger.debug(f"Received ICE candidate for client {client_id}")
 
     try:
+        # Parse here, while the message is being decoded, so the manager only has to apply it.
+        # An empty candidate string is the end-of-candidates signal (None for aiortc)
+        ice_candidate = None
+        candidate_string = candidate_dict.get("candidate", "")
+        if candidate_string:
+            ice_candidate = parse_ice_candidate(
+                candidate_string,
+                candidate_dict.get("sdpMid"),
+                candidate_dict.get("sdpMLineIndex")
+            )
+            if ice_candidate is None:
+                logger.warning(f"Invalid ICE candidate from client {client_id}: {candidate_string}")
+                return
+        
         # Add candidate to WebRTC manager
-        result = await app_state.webrtc_manager.add_ice_candidate(client_id, candidate_dict)
+        result = await app_state.webrtc_manager.apply_ice_candidate(client_id, ice_candidate)
         
         if result:
             logger.debug(f"Successfully added ICE candidate for client {client_id}")
         else:
             logger.debug(f"Could not add ICE candidate for client {client_id}")
             
-    except Exception as e:
-        logger.error(f"Error handling ICE candidate: {e}")
-        traceback.print_exc()
\ No newline at end of file
+    except Exception:
+        logger.exception("Error handling ICE candidate for %s", client_id)
\ No newline at end of file
@@ -1,8 +1,10 @@
 import asyncio
+import concurrent.futures
+import dataclasses
 import logging
 import os
 import time
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Set, Tuple
 
 import av
 import cv2
@@ -15,6 +17,26 @@ import re # Need re for parsing
 
 logger = logging.getLogger('webrtc_manager')
 
+# Precompiled ICE candidate grammar (RFC 5245 section 15.1):
+# "candidate:foundation component protocol priority ip port typ type [extensions...]"
+_CAND_RE = re.compile(r"^candidate:(\S+) (\d+) (\S+) (\d+) (\S+) (\d+) typ (\S+)")
+# Optional "name value" extension pairs that follow the candidate type
+_CAND_EXT_RE = re.compile(r" (raddr|rport|tcptype) (\S+)")
+
+# Connection / ICE states after which a peer connection is unusable
+_DEAD_STATES = frozenset(("closed", "failed"))
+
+# Older aiortc releases only expose iceConnectionState - probe once instead of per peer/poll
+_HAS_CONN_STATE = hasattr(RTCPeerConnection, "connectionState")
+
+# addIceCandidate timeout: a multiple of the peer's recent add latency, floored
+# near the ICE retransmission timeout so a stalled add doesn't pin a task for long
+_ICE_ADD_TIMEOUT_MIN = 0.25
+_ICE_ADD_TIMEOUT_FACTOR = 4
+_ICE_ADD_DEFAULT_LATENCY = 0.1
+# mDNS (.local) host candidates need a multicast lookup that routinely takes ~1s
+_ICE_ADD_TIMEOUT_MDNS = 5.0
+
 # Video quality configurations optimized for performance
 VIDEO_CONFIGS = {
     "low": {"width": 640, "height": 360, "fps": 15},
@@ -23,59 +45,187 @@ VIDEO_CONFIGS = {
     "hd": {"width": 1920, "height": 1080, "fps": 20}     # Further reduced framerate for high-res
 }
 
+@dataclasses.dataclass(slots=True)
+class ConnInfo:
+    """Cached states of one peer connection, mutated in place on state-change events"""
+    conn: str = "new"
+    ice: str = "new"
+    gather: str = "new"
+    sig: str = "stable"
+    
+    def as_dict(self):
+        return {
+            "connectionState": self.conn,
+            "iceConnectionState": self.ice,
+            "iceGatheringState": self.gather,
+            "signalingState": self.sig
+        }
+
+def parse_ice_candidate(candidate_string, sdpMid=None, sdpMLineIndex=None) -> Optional[RTCIceCandidate]:
+    """
+    Parse an SDP candidate string into an RTCIceCandidate.
+    Returns None if the string is malformed or no constructor signature accepts it.
+    """
+    # Example: "candidate:foundation 1 component protocol priority ip port typ type [raddr ip] [rport port] ..."
+    match = _CAND_RE.match(candidate_string)
+    if match is None:
+        return None
+
+    foundation = match.group(1)
+    component_id = int(match.group(2)) # 1 for RTP, 2 for RTCP
+    protocol = match.group(3).lower()
+    priority = int(match.group(4))
+    ip = match.group(5)
+    port = int(match.group(6))
+    candidate_type = match.group(7)
+
+    # Extract optional related address/port and tcp type
+    extensions = dict(_CAND_EXT_RE.findall(candidate_string, match.end()))
+    related_address = extensions.get("raddr")
+    related_port = int(extensions["rport"]) if "rport" in extensions else None
+    tcp_type = extensions.get("tcptype")
+    
+    # Network debugging - reuses the fields from the parse above
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("ICE candidate IP: %s (%s %s, raddr %s)", ip, protocol, candidate_type, related_address)
+
+    # --- Attempt 1: Use the older-style positional constructor (currently working) ---
+    try:
+        return RTCIceCandidate(
+            component=component_id, foundation=foundation, ip=ip, port=port,
+            priority=priority, protocol=protocol, type=candidate_type,
+            relatedAddress=related_address, relatedPort=related_port,
+            sdpMid=sdpMid, sdpMLineIndex=sdpMLineIndex, tcpType=tcp_type
+        )
+    except TypeError as te_pos:
+        logger.warning("Positional RTCIceCandidate constructor failed (%s: %s). Will attempt keyword constructor.", type(te_pos).__name__, te_pos)
+        
+    # --- Attempt 2: Fallback to modern keyword constructor (sdp=) ---
+    try:
+        return RTCIceCandidate(
+            sdp=candidate_string,
+            sdpMid=sdpMid,
+            sdpMLineIndex=sdpMLineIndex
+        )
+    except TypeError as te_kw:
+        logger.error("Keyword RTCIceCandidate constructor also failed (%s: %s). Cannot create candidate.", type(te_kw).__name__, te_kw)
+        return None
+
+def blank_yuv420p(width, height):
+    """Return a black frame in I420 layout (a (height * 3 // 2, width) uint8 plane stack)"""
+    return cv2.cvtColor(np.zeros((height, width, 3), dtype=np.uint8), cv2.COLOR_BGR2YUV_I420)
+
 class FrameTransformer:
     """
     Transform frames before sending over WebRTC.
     Optimized with caching and faster processing for better performance.
+    
+    BGR input frames are scaled/letterboxed and converted to YUV420P (I420),
+    the layout every codec we negotiate encodes from, so libav doesn't have to
+    convert them again. Output frames are written into a small ring of
+    preallocated buffers, so a returned frame stays valid until
+    ``num_buffers`` further transforms.
     """
-    def __init__(self, width=640, height=480):
+    def __init__(self, width=640, height=480, num_buffers=3, use_opencl=False):
         self.width = width
         self.height = height
         self.last_frame = None
+        self._dst_size = (width, height)
+        
+        # OpenCV T-API: run resize/letterbox/color conversion on the OpenCL device
+        self._use_opencl = use_opencl
+        
+        # Black frame returned when there is nothing better - built once, never written to
+        self.blank_frame = blank_yuv420p(width, height)
+        
+        # Preallocated output ring - callers may still hold the last few frames
+        self._num_buffers = max(2, num_buffers)
+        self._out_bufs = [np.empty((height * 3 // 2, width), dtype=np.uint8) for _ in range(self._num_buffers)]
+        self._buf_idx = 0
+        
+        # Scratch buffers reused on every frame (sized on first use / geometry change).
+        # The BGR canvas holds the scaled frame plus black letterbox borders
+        # until it is converted into the output ring.
+        self._scaled_buf = None
+        self._bgr_canvas = None
         
         # Cache for optimization
         self._last_input_shape = None
         self._last_src_aspect = None
-        self._cached_canvas = None
         self._y_offset = 0
         self._x_offset = 0
         self._new_height = 0
         self._new_width = 0
-        self._resize_method = None  # 'width', 'height', or 'direct'
+        self._resize_method = None  # 'none', 'direct', 'width' or 'height'
+        self._scale = None  # bound _scale_* method for the current geometry
+        self._interp = cv2.INTER_AREA
+        self._yuv_code = cv2.COLOR_BGR2YUV_I420
         
         # Performance tracking
         self._transform_count = 0
         self._cached_transforms = 0
         self._start_time = time.time()
         
+    def _next_output(self):
+        """Return the next buffer of the output ring"""
+        buf = self._out_bufs[self._buf_idx]
+        self._buf_idx = (self._buf_idx + 1) % self._num_buffers
+        return buf
+        
+    def _scale_none(self, frame):
+        """Dimensions already match - use the frame as-is"""
+        return frame
+        
+    def _scale_direct(self, frame):
+        """Simple resize - aspect ratios match"""
+        return cv2.resize(frame, self._dst_size, dst=self._bgr_canvas, interpolation=self._interp)
+        
+    def _scale_width(self, frame):
+        """Scale to width and center vertically; borders of the canvas stay black"""
+        scaled = cv2.resize(frame, (self.width, self._new_height), dst=self._scaled_buf, interpolation=self._interp)
+        self._bgr_canvas[self._y_offset:self._y_offset+self._new_height, 0:self.width] = scaled
+        return self._bgr_canvas
+        
+    def _scale_height(self, frame):
+        """Scale to height and center horizontally"""
+        scaled = cv2.resize(frame, (self._new_width, self.height), dst=self._scaled_buf, interpolation=self._interp)
+        self._bgr_canvas[0:self.height, self._x_offset:self._x_offset+self._new_width] = scaled
+        return self._bgr_canvas
+        
+    def _scale_umat(self, umat):
+        """Scale/letterbox a cv2.UMat to the output size (OpenCL path)"""
+        if self._resize_method == 'none':
+            return umat
+        if self._resize_method == 'direct':
+            return cv2.resize(umat, self._dst_size, interpolation=self._interp)
+        if self._resize_method == 'width':
+            scaled = cv2.resize(umat, (self.width, self._new_height), interpolation=self._interp)
+            top = self._y_offset
+            bottom = self.height - self._new_height - top
+            return cv2.copyMakeBorder(scaled, top, bottom, 0, 0, cv2.BORDER_CONSTANT, value=0)
+        scaled = cv2.resize(umat, (self._new_width, self.height), interpolation=self._interp)
+        left = self._x_offset
+        right = self.width - self._new_width - left
+        return cv2.copyMakeBorder(scaled, 0, 0, left, right, cv2.BORDER_CONSTANT, value=0)
+        
     def transform(self, frame):
         """Optimized frame processing for WebRTC with aspect ratio preservation"""
+        # Skip unnecessary copying if possible
+        if frame is None:
+            if self.last_frame is not None:
+                return self.last_frame
+            else:
+                return self.blank_frame
+                
+        # Performance tracking
+        self._transform_count += 1
+        
+        # Only the geometry setup and the OpenCV calls can reasonably fail
         try:
-            # Skip unnecessary copying if possible
-            if frame is None:
-                if self.last_frame is not None:
-                    return self.last_frame
-                else:
-                    return np.zeros((self.height, self.width, 3), dtype=np.uint8)
-                    
-            # Performance tracking
-            self._transform_count += 1
-            
             # Check dimensions
             input_shape = frame.shape
             src_width, src_height = input_shape[1], input_shape[0]
             
-            # Fast path: dimensions already match, just convert color
-            if src_width == self.width and src_height == self.height:
-                # Color conversion is still needed
-                if input_shape[2] == 3:  # Only convert if 3-channel
-                    result = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                else:
-                    result = frame  # Use as-is
-                    
-                self.last_frame = result
-                return result
-                
             # Check if frame dimensions match our cached calculations
             cache_hit = (input_shape == self._last_input_shape)
             
@@ -85,9 +235,21 @@ class FrameTransformer:
                 dst_aspect = self.width / self.height
                 self._last_input_shape = input_shape
                 self._last_src_aspect = src_aspect
+                channels = input_shape[2] if len(input_shape) == 3 else 1
+                self._yuv_code = cv2.COLOR_BGRA2YUV_I420 if channels == 4 else cv2.COLOR_BGR2YUV_I420
+                
+                # Area averaging for downscales, bilinear for upscales
+                if self.width * self.height < src_width * src_height:
+                    self._interp = cv2.INTER_AREA
+                else:
+                    self._interp = cv2.INTER_LINEAR
                 
                 # Determine resize method
-                if abs(src_aspect - dst_aspect) < 0.01:
+                self._scaled_buf = None
+                if src_width == self.width and src_height == self.height:
+                    # Dimensions already match - straight to the color conversion
+                    self._resize_method = 'none'
+                elif abs(src_aspect - dst_aspect) < 0.01:
                     # Aspect ratios close enough, use direct resize
                     self._resize_method = 'direct'
                 elif src_aspect > dst_aspect:
@@ -95,85 +257,64 @@ class FrameTransformer:
                     self._resize_method = 'width'
                     self._new_height = int(self.width / src_aspect)
                     self._y_offset = (self.height - self._new_height) // 2
-                    # Pre-create canvas
-                    self._cached_canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+                    self._scaled_buf = np.empty((self._new_height, self.width, channels), dtype=np.uint8)
                 else:
                     # Source is taller, scale to target height and center horizontally
                     self._resize_method = 'height'
                     self._new_width = int(self.height * src_aspect)
                     self._x_offset = (self.width - self._new_width) // 2
-                    # Pre-create canvas
-                    self._cached_canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+                    self._scaled_buf = np.empty((self.height, self._new_width, channels), dtype=np.uint8)
+                    
+                # Fresh black canvas so no stale letterbox content survives a geometry change
+                self._bgr_canvas = np.zeros((self.height, self.width, channels), dtype=np.uint8)
+                
+                # Bind the scaling step once per geometry so the per-frame path has no branching
+                self._scale = {
+                    'none': self._scale_none,
+                    'direct': self._scale_direct,
+                    'width': self._scale_width,
+                    'height': self._scale_height,
+                }[self._resize_method]
             else:
                 self._cached_transforms += 1
                 
-            # Convert color first - PyAV's VideoFrame.from_ndarray expects RGB
-            if input_shape[2] == 3:  # Only convert if 3-channel
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # Scale to output resolution in BGR with the method bound for this
+            # geometry, then convert to I420 straight into the output ring
+            if self._use_opencl:
+                # Everything stays on the device; only the final I420 frame is downloaded
+                result = cv2.cvtColor(self._scale_umat(cv2.UMat(frame)), self._yuv_code).get()
             else:
-                rgb_frame = frame  # Use as-is
-                
-            # Apply the appropriate transformation
-            if self._resize_method == 'direct':
-                # Simple resize - aspect ratios match
-                result = cv2.resize(
-                    rgb_frame, 
-                    (self.width, self.height),
-                    interpolation=cv2.INTER_AREA
-                )
-            elif self._resize_method == 'width':
-                # Scale to width and center vertically
-                scaled = cv2.resize(
-                    rgb_frame, 
-                    (self.width, self._new_height),
-                    interpolation=cv2.INTER_AREA
-                )
-                # Create fresh canvas (avoid using cached one to prevent artifacts)
-                canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-                # Place on canvas
-                canvas[self._y_offset:self._y_offset+self._new_height, 0:self.width] = scaled
-                result = canvas
-            else:  # self._resize_method == 'height'
-                # Scale to height and center horizontally
-                scaled = cv2.resize(
-                    rgb_frame, 
-                    (self._new_width, self.height),
-                    interpolation=cv2.INTER_AREA
-                )
-                # Create fresh canvas
-                canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-                # Place on canvas
-                canvas[0:self.height, self._x_offset:self._x_offset+self._new_width] = scaled
-                result = canvas
-                
-            # Store last successfully processed frame
-            self.last_frame = result
-            
-            # Log performance stats periodically
-            elapsed = time.time() - self._start_time
-            if self._transform_count % 300 == 0 and elapsed > 0:
-                transforms_per_sec = self._transform_count / elapsed
-                cache_ratio = (self._cached_transforms / max(1, self._transform_count)) * 100
-                logger.debug(f"FrameTransformer stats: {transforms_per_sec:.1f} transforms/sec, " +
-                             f"cache hit ratio: {cache_ratio:.1f}%")
-                
-            return result
-            
+                result = cv2.cvtColor(self._scale(frame), self._yuv_code, dst=self._next_output())
+
         except Exception as e:
             logger.error(f"Frame transform error: {e}")
             
-            # Return last good frame or create blank frame
+            # Return last good frame or the blank frame
             if self.last_frame is not None:
                 return self.last_frame
             else:
-                return np.zeros((self.height, self.width, 3), dtype=np.uint8)
+                return self.blank_frame
+                
+        # Store last successfully processed frame
+        self.last_frame = result
+        
+        # Log performance stats periodically
+        if self._transform_count % 300 == 0 and logger.isEnabledFor(logging.DEBUG):
+            elapsed = time.time() - self._start_time
+            if elapsed > 0:
+                transforms_per_sec = self._transform_count / elapsed
+                cache_ratio = (self._cached_transforms / max(1, self._transform_count)) * 100
+                logger.debug("FrameTransformer stats: %.1f transforms/sec, cache hit ratio: %.1f%%",
+                             transforms_per_sec, cache_ratio)
+            
+        return result
 
 class FrameVideoStreamTrack(VideoStreamTrack):
     """
     A video stream track that sends frames from the simulation with enhanced reliability.
     Uses aiortc's VideoStreamTrack with improvements for smoother playback.
     """
-    def __init__(self, width=640, height=480, fps=30):
+    def __init__(self, width=640, height=480, fps=30, frame_transformer=None):
         super().__init__()
         self.width = width
         self.height = height
@@ -182,19 +323,23 @@ class FrameVideoStreamTrack(VideoStreamTrack):
         # Target frame duration in seconds
         self.frame_duration = 1.0 / fps
         
-        # Frame transformer for processing frames
-        self.frame_transformer = FrameTransformer(width, height)
+        # Latest-frame slot: push_frame overwrites self.last_frame and sets this
+        # event; recv clears it once it has taken the frame. Newer frames simply
+        # replace unsent ones, so there is no queue to drain.
+        self._frame_event = asyncio.Event()
         
-        # Use a larger queue to buffer frames during unstable periods
-        # This helps prevent stream interruptions during short network issues
-        self.frame_queue = asyncio.Queue(maxsize=3)
+        # Frame transformer for processing frames - may be shared between tracks of the
+        # same size. Its output buffers are reused, so keep enough of them for the
+        # pending frame, the one recv is sending and the one being written
+        if frame_transformer is None:
+            frame_transformer = FrameTransformer(width, height, num_buffers=3)
+        self.frame_transformer = frame_transformer
         
         # Tracking for stats and debug
         self.counter = 0
         self.frames_processed = 0
         self.dropped_frames = 0
         self.start_time = time.time()
-        self.last_frame_time = time.time()
         
         # Use fractions for time_base (standard in aiortc)
         self.time_base = fractions.Fraction(1, 90000)
@@ -205,75 +350,68 @@ class FrameVideoStreamTrack(VideoStreamTrack):
         # Last successfully processed frame (for fallback)
         self.last_frame = None
         
+        # Black frame for the fallback/error paths, built once instead of per failure
+        self._blank_frame = self.frame_transformer.blank_frame
+        
+        # Reused libav frame: recv copies each I420 frame into its planes instead of
+        # allocating a new AVFrame per call. The sender encodes a frame before it
+        # asks for the next one, so overwriting it on the following recv is safe.
+        self._av_frame = av.VideoFrame(width, height, "yuv420p")
+        self._plane_views = self._map_planes(self._av_frame)
+        
         # Frame timestamp tracking for smooth delivery
         self.last_pts = 0
         self.frame_interval = int(90000 / fps)  # in pts units
         
-        logger.info(f"FrameVideoStreamTrack initialized: {width}x{height}@{fps}fps")
+        logger.info("FrameVideoStreamTrack initialized: %dx%d@%sfps", width, height, fps)
         
-    def update_frame(self, frame):
-        """Update the frame to be sent to connected peers with improved handling"""
-        try:
-            # Reset error counter on successful calls
-            self.consecutive_errors = 0
-            
-            # Transform the frame
-            processed_frame = self.frame_transformer.transform(frame)
-            
-            # Track successful frame processing
-            self.frames_processed += 1
-            current_time = time.time()
-            frame_time_delta = current_time - self.last_frame_time
-            self.last_frame_time = current_time
-            
-            # Add to queue with backpressure handling
-            try:
-                # Try to add to queue without waiting
-                self.frame_queue.put_nowait(processed_frame)
-            except asyncio.QueueFull:
-                # Queue is full - we need to drop a frame
-                
-                # During normal operation, drop the oldest frame
-                # During high load, drop all frames and just keep the newest
-                if frame_time_delta > 2 * self.frame_duration:
-                    # We're getting frames too slowly - clear queue and add newest
-                    while not self.frame_queue.empty():
-                        try:
-                            _ = self.frame_queue.get_nowait()
-                            self.dropped_frames += 1
-                        except Exception:
-                            pass
-                else:
-                    # Normal operation - just drop oldest frame
-                    try:
-                        _ = self.frame_queue.get_nowait()
-                        self.dropped_frames += 1
-                    except Exception:
-                        pass
-                
-                # Now add our current frame
-                try:
-                    self.frame_queue.put_nowait(processed_frame)
-                except asyncio.QueueFull:
-                    logger.warning("Queue still full after cleanup - frame dropped")
-                    self.dropped_frames += 1
-                    
-            # Periodically log stats
-            if self.frames_processed % 300 == 0:
-                drop_percent = (self.dropped_frames / max(1, self.frames_processed)) * 100
-                logger.debug(f"Frame stats: processed={self.frames_processed}, dropped={self.dropped_frames} ({drop_percent:.1f}%)")
+    def _map_planes(self, video_frame):
+        """Return writable (rows, width) numpy views of the Y, U and V planes, skipping row padding"""
+        views = []
+        for plane, plane_width, plane_height in zip(
+            video_frame.planes,
+            (self.width, self.width // 2, self.width // 2),
+            (self.height, self.height // 2, self.height // 2),
+        ):
+            rows = np.frombuffer(plane, dtype=np.uint8).reshape(plane_height, plane.line_size)
+            views.append(rows[:, :plane_width])
+        return views
+        
+    def _fill_av_frame(self, frame):
+        """Copy an I420 (height * 3 // 2, width) array into the reused VideoFrame"""
+        y_size = self.width * self.height
+        c_size = y_size // 4
+        flat = frame.reshape(-1)
+        y_view, u_view, v_view = self._plane_views
+        np.copyto(y_view, flat[:y_size].reshape(y_view.shape))
+        np.copyto(u_view, flat[y_size:y_size + c_size].reshape(u_view.shape))
+        np.copyto(v_view, flat[y_size + c_size:].reshape(v_view.shape))
+        return self._av_frame
+        
+    def push_frame(self, processed_frame):
+        """
+        Publish a frame already produced by ``frame_transformer``.
+        
+        Must be called on the event loop thread - asyncio.Event is not thread-safe.
+        Nothing here can fail; transform errors are handled inside the transformer.
+        """
+        # Reset error counter on successful calls
+        self.consecutive_errors = 0
+        
+        # Track successful frame processing
+        self.frames_processed += 1
+        
+        # A still-pending frame that recv never picked up is replaced (dropped)
+        if self._frame_event.is_set():
+            self.dropped_frames += 1
+        self.last_frame = processed_frame
+        self._frame_event.set()
                 
-            # Save last successful frame for fallback
-            self.last_frame = processed_frame
-            
-        except Exception as e:
-            self.consecutive_errors += 1
-            if self.consecutive_errors < 5:
-                logger.error(f"Error updating frame: {e}")
-            else:
-                # Only log occasionally after many errors to avoid flooding logs
-                if self.consecutive_errors % 100 == 0:
-                    logger.error(f"Still encountering frame update errors after {self.consecutive_errors} attempts: {e}")
+        # Periodically log stats
+        if self.frames_processed % 300 == 0 and logger.isEnabledFor(logging.DEBUG):
+            drop_percent = (self.dropped_frames / max(1, self.frames_processed)) * 100
+            logger.debug("Frame stats: processed=%d, dropped=%d (%.1f%%)",
+                         self.frames_processed, self.dropped_frames, drop_percent)
             
     async def recv(self):
         """Get the next frame to send with improved timing and reliability"""
@@ -287,28 +425,31 @@ class FrameVideoStreamTrack(VideoStreamTrack):
                 # First frame - base on wall clock
                 target_pts = int((time.time() - self.start_time) * 90000)
             
-            # Try to get a frame with timeout
+            # Wait for a new frame with timeout
             frame = None
             try:
                 # Shorter timeout for more responsive frame delivery
-                frame = await asyncio.wait_for(self.frame_queue.get(), timeout=0.5)
+                if not self._frame_event.is_set():
+                    await asyncio.wait_for(self._frame_event.wait(), timeout=0.5)
+                self._frame_event.clear()
+                frame = self.last_frame
                 
                 # Reset error counter on successful frame fetch
                 self.consecutive_errors = 0
                 
-            except (asyncio.TimeoutError, asyncio.QueueEmpty):
-                # Use last transformed frame as fallback
+            except asyncio.TimeoutError:
+                # Repeat the last transformed frame as fallback
                 frame = self.last_frame
                 
                 if frame is None:
-                    # Create blank RGB frame as last resort fallback
-                    frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+                    # Create blank frame as last resort fallback
+                    frame = self._blank_frame
                     logger.debug("Using blank frame fallback")
                 else:
-                    logger.debug("Using last cached frame due to queue timeout")
+                    logger.debug("Using last cached frame due to frame wait timeout")
             
-            # Convert to VideoFrame - frame should already be in RGB format
-            video_frame = av.VideoFrame.from_ndarray(frame, format="rgb24")
+            # Copy into the reused VideoFrame - the transformer already produced I420
+            video_frame = self._fill_av_frame(frame)
             
             # Use calculated PTS for smoother playback
             video_frame.pts = target_pts
@@ -330,7 +471,7 @@ class FrameVideoStreamTrack(VideoStreamTrack):
                     logger.error(f"Still encountering recv errors after {self.consecutive_errors} attempts: {e}")
                 
             # Create blank frame as ultimate fallback
-            blank_frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+            blank_frame = self._blank_frame
             
             # Try to maintain proper timing even in error case
             target_pts = 0
@@ -339,7 +480,7 @@ class FrameVideoStreamTrack(VideoStreamTrack):
             else:
                 target_pts = int((time.time() - self.start_time) * 90000)
                 
-            video_frame = av.VideoFrame.from_ndarray(blank_frame, format="rgb24")
+            video_frame = av.VideoFrame.from_ndarray(blank_frame, format="yuv420p")
             video_frame.pts = target_pts
             video_frame.time_base = self.time_base
             
@@ -352,7 +493,16 @@ class WebRTCManager:
     """
     Simplified WebRTC manager using aiortc library.
     """
-    def __init__(self, video_quality="medium"):
+    def __init__(self, video_quality="medium", use_opencl=False):
+        # Environment doesn't change at runtime - snapshot it once for stats
+        self._env_vars_snapshot = {
+            "USE_ICE_SERVER": os.getenv("USE_ICE_SERVER", "Not set"),
+            "STUN_URL": os.getenv("VITE_STUN_URL", "Not set"),
+            "TURN_URL": os.getenv("VITE_TURN_URL", "Not set"),
+            "TURN_USERNAME": "Set" if os.getenv("VITE_TURN_USERNAME") else "Not set",
+            "TURN_PASSWORD": "Set" if os.getenv("VITE_TURN_PASSWORD") else "Not set"
+        }
+        
         # Configure ICE servers
         self.ice_servers = self._configure_ice_servers()
         
@@ -369,6 +519,49 @@ class WebRTCManager:
         self.peer_connections: Dict[str, RTCPeerConnection] = {}
         self.tracks: Dict[str, FrameVideoStreamTrack] = {}
         
+        # ICE candidates trickled in while a connection is still negotiating,
+        # applied once the remote description has been set
+        self._pending_candidates: Dict[str, List[Optional[RTCIceCandidate]]] = {}
+        
+        # Serialize addIceCandidate per peer; aiortc processes them one at a time anyway
+        self._ice_sem: Dict[str, asyncio.Semaphore] = {}
+        
+        # EWMA of successful addIceCandidate latency per peer (seconds)
+        self._ice_add_ewma: Dict[str, float] = {}
+        
+        # Per-peer connection states, refreshed from state-change events so
+        # stats polling doesn't have to walk every RTCPeerConnection
+        self._conn_state_cache: Dict[str, ConnInfo] = {}
+        
+        # Peers not yet in a closed/failed state; stats only walk these
+        self._alive_peer_ids: Set[str] = set()
+        
+        # Number of peers whose connectionState is "connected", maintained on
+        # state transitions instead of counted by walking every connection
+        self._connected_count = 0
+        
+        # Time of the last logged ICE traceback - at most one per second
+        self._last_ice_traceback = 0.0
+        
+        # One FrameTransformer per output size, shared by every track of that size
+        self._frame_transformers: Dict[Tuple[int, int], FrameTransformer] = {}
+        
+        # Optional OpenCL offload of frame preprocessing - only if a device is available
+        self._use_opencl = False
+        if use_opencl:
+            if cv2.ocl.haveOpenCL():
+                cv2.ocl.setUseOpenCL(True)
+                self._use_opencl = cv2.ocl.useOpenCL()
+            if not self._use_opencl:
+                logger.warning("OpenCL requested for WebRTC frame preprocessing but not available - using CPU")
+        
+        # Frame resize/color conversion runs here instead of on the event loop
+        # thread; OpenCV releases the GIL, so it overlaps with signaling/ICE work.
+        # A single worker keeps the transformers' output rings strictly ordered.
+        self._preproc_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="webrtc-preproc"
+        )
+        
         # Stats
         self.stats = {
             "created_connections": 0,
@@ -379,7 +572,7 @@ class WebRTCManager:
         # Environment reference (set later)
         self.env = None
         
-        logger.info(f"WebRTC manager initialized with {video_quality} quality")
+        logger.info("WebRTC manager initialized with %s quality", video_quality)
         
     def _configure_ice_servers(self) -> List[RTCIceServer]:
         """Configure ICE servers based on environment variables"""
@@ -425,7 +618,7 @@ class WebRTCManager:
                     credential=turn_password
                 ))
                 
-        logger.info(f"Configured {len(ice_servers)} ICE servers")
+        logger.info("Configured %d ICE servers", len(ice_servers))
         return ice_servers
         
     def set_environment(self, env):
@@ -437,7 +630,7 @@ class WebRTCManager:
         """Set the video quality for new connections"""
         if quality_name in VIDEO_CONFIGS:
             self.video_config = VIDEO_CONFIGS[quality_name]
-            logger.info(f"Video quality set to {quality_name}: {self.video_config}")
+            logger.info("Video quality set to %s: %s", quality_name, self.video_config)
             return True
         else:
             logger.warning(f"Unknown quality '{quality_name}', using medium")
@@ -449,29 +642,45 @@ class WebRTCManager:
         try:
             # Close any existing connection first
             if client_id in self.peer_connections:
-                logger.info(f"Closing existing connection for {client_id}")
+                logger.info("Closing existing connection for %s", client_id)
                 await self.close_connection(client_id)
                 
             # Create new peer connection
             pc = RTCPeerConnection(configuration=self.rtc_configuration)
-            logger.info(f"Created peer connection for {client_id}")
+            logger.info("Created peer connection for %s", client_id)
+            
+            # Park candidates that arrive before the remote description is set
+            self._pending_candidates[client_id] = []
             
             # Event handlers
             @pc.on("connectionstatechange")
             async def on_connectionstatechange():
-                logger.info(f"Connection state changed to {pc.connectionState} for {client_id}")
-                if pc.connectionState == "failed" or pc.connectionState == "closed":
+                logger.info("Connection state changed to %s for %s", pc.connectionState, client_id)
+                self._update_conn_state(client_id, pc)
+                if pc.connectionState in _DEAD_STATES:
                     await self.close_connection(client_id)
                     
             @pc.on("iceconnectionstatechange")
             async def on_iceconnectionstatechange():
-                logger.info(f"ICE connection state changed to {pc.iceConnectionState} for {client_id}")
+                logger.info("ICE connection state changed to %s for %s", pc.iceConnectionState, client_id)
+                self._update_conn_state(client_id, pc)
+                
+            @pc.on("icegatheringstatechange")
+            def on_icegatheringstatechange():
+                self._update_conn_state(client_id, pc)
+                
+            @pc.on("signalingstatechange")
+            def on_signalingstatechange():
+                self._update_conn_state(client_id, pc)
                 
             # Create video track
             track = FrameVideoStreamTrack(
                 width=self.video_config["width"],
                 height=self.video_config["height"],
-                fps=self.video_config["fps"]
+                fps=self.video_config["fps"],
+                frame_transformer=self._get_frame_transformer(
+                    self.video_config["width"], self.video_config["height"]
+                )
             )
             
             # Add track to peer connection
@@ -490,11 +699,18 @@ class WebRTCManager:
             # Store connection and track
             self.peer_connections[client_id] = pc
             self.tracks[client_id] = track
+            self._ice_sem[client_id] = asyncio.Semaphore(1)
+            self._conn_state_cache[client_id] = ConnInfo()
+            self._alive_peer_ids.add(client_id)
+            self._update_conn_state(client_id, pc)
             
             # Update stats
             self.stats["created_connections"] += 1
             self.stats["active_connections"] = len(self.peer_connections)
             
+            # Apply any candidates that arrived while we were negotiating
+            await self._drain_pending_candidates(client_id)
+            
             # Return the answer
             return {
                 "sdp": pc.localDescription.sdp,
@@ -503,131 +719,110 @@ class WebRTCManager:
             
         except Exception as e:
             logger.error(f"Error creating peer connection: {e}")
+            self._pending_candidates.pop(client_id, None)
             return None
             
-    async def add_ice_candidate(self, client_id, candidate_dict):
-        """Add an ICE candidate - parsing the string to match the runtime's expected signature."""
+    def _update_conn_state(self, client_id, pc):
+        """Refresh the cached states of a registered peer connection"""
+        info = self._conn_state_cache.get(client_id)
+        if info is None:
+            return
+        was_connected = info.conn == "connected"
+        info.conn = pc.connectionState if _HAS_CONN_STATE else "Unknown"
+        is_connected = info.conn == "connected"
+        if is_connected != was_connected:
+            self._connected_count += 1 if is_connected else -1
+        info.ice = pc.iceConnectionState
+        info.gather = pc.iceGatheringState
+        info.sig = pc.signalingState
+        if info.conn in _DEAD_STATES or info.ice in _DEAD_STATES:
+            self._alive_peer_ids.discard(client_id)
+            
+    def _forget_conn_state(self, client_id):
+        """Drop the cached states of a peer, keeping the connected count in step"""
+        info = self._conn_state_cache.pop(client_id, None)
+        if info is not None and info.conn == "connected":
+            self._connected_count -= 1
+            
+    async def _drain_pending_candidates(self, client_id):
+        """Apply candidates buffered before the remote description was set"""
+        pending = self._pending_candidates.pop(client_id, None)
+        if not pending:
+            return
+            
+        logger.debug("Applying %d buffered ICE candidates for %s", len(pending), client_id)
+        for ice_candidate in pending:
+            await self.apply_ice_candidate(client_id, ice_candidate)
+            
+    async def apply_ice_candidate(self, client_id, ice_candidate: Optional[RTCIceCandidate]):
+        """Add an already parsed ICE candidate (None for end-of-candidates) to a peer connection."""
         try:
-            if not candidate_dict or client_id not in self.peer_connections:
-                logger.warning(f"Cannot add ICE candidate for non-existent client {client_id}")
-                return False
-
-            pc = self.peer_connections[client_id]
+            pc = self.peer_connections.get(client_id)
             
-            # Extract core info
-            sdpMid = candidate_dict.get("sdpMid")
-            sdpMLineIndex = candidate_dict.get("sdpMLineIndex")
-            candidate_string = candidate_dict.get("candidate", "")
-
-            if not candidate_string:
-                # Empty candidate string signals end-of-candidates
-                logger.debug(f"Received end-of-candidates signal for {client_id}")
-                # aiortc's addIceCandidate expects None for end-of-candidates
-                # However, the underlying aioice might expect an empty candidate object?
-                # Let's try passing None first, as per aiortc docs for addIceCandidate
-                # If pc.addIceCandidate is the modern one, it should handle None correctly.
-                await pc.addIceCandidate(None) 
+            # Connection still negotiating - buffer until the remote description is set
+            pending = self._pending_candidates.get(client_id)
+            if pending is not None and (pc is None or pc.remoteDescription is None):
+                pending.append(ice_candidate)
+                logger.debug("Buffered ICE candidate for %s until remote description is set", client_id)
                 return True
-
-            # --- Parse the candidate string ---
-            # Example: "candidate:foundation 1 component protocol priority ip port typ type [raddr ip] [rport port] ..."
-            parts = candidate_string.split()
-
-            if not parts or not parts[0].startswith("candidate:"):
-                 logger.error(f"Invalid candidate string format for {client_id}: {candidate_string}")
-                 return False
-                 
-            foundation = parts[0].split(":")[1]
-            component_id = int(parts[1]) # 1 for RTP, 2 for RTCP
-            protocol = parts[2].lower()
-            priority = int(parts[3])
-            ip = parts[4]
-            port = int(parts[5])
-            
-            # Find 'typ' and the actual type value
-            try:
-                 typ_index = parts.index("typ")
-                 candidate_type = parts[typ_index + 1]
-            except (ValueError, IndexError):
-                 logger.error(f"Could not find 'typ' in candidate string for {client_id}: {candidate_string}")
-                 return False
-            
-            # Extract optional related address and port
-            related_address = None
-            related_port = None
-            try:
-                raddr_index = parts.index("raddr")
-                related_address = parts[raddr_index + 1]
-            except ValueError:
-                pass # Optional
-            try:
-                rport_index = parts.index("rport")
-                related_port = int(parts[rport_index + 1])
-            except ValueError:
-                pass # Optional
-                
-            # Extract optional tcp type
-            tcp_type = None
-            try:
-                 tcptype_index = parts.index("tcptype")
-                 tcp_type = parts[tcptype_index + 1]
-            except ValueError:
-                pass # Optional
-
-            ice_candidate = None # Initialize variable
+                    
+            if pc is None:
+                logger.warning("Cannot add ICE candidate for non-existent client %s", client_id)
+                return False
             
-            # --- Attempt 1: Use the older-style positional constructor (currently working) ---
-            try:
-                 logger.debug(f"Attempting RTCIceCandidate with positional args for {client_id}")
-                 ice_candidate = RTCIceCandidate(
-                     component=component_id, foundation=foundation, ip=ip, port=port,
-                     priority=priority, protocol=protocol, type=candidate_type,
-                     relatedAddress=related_address, relatedPort=related_port,
-                     sdpMid=sdpMid, sdpMLineIndex=sdpMLineIndex, tcpType=tcp_type
-                 )
-                 logger.info(f"Successfully created RTCIceCandidate using positional args for {client_id}")
-            except TypeError as te_pos:
-                 logger.warning(f"Positional RTCIceCandidate constructor failed ({type(te_pos).__name__}: {te_pos}). Will attempt keyword constructor.")
-                 # --- Attempt 2: Fallback to modern keyword constructor (sdp=) ---
-                 try:
-                     logger.debug(f"Attempting RTCIceCandidate with keyword args for {client_id}")
-                     ice_candidate = RTCIceCandidate(
-                         sdp=candidate_string,
-                         sdpMid=sdpMid,
-                         sdpMLineIndex=sdpMLineIndex
-                         # Optional: usernameFragment=... if needed
-                     )
-                     logger.info(f"Successfully created RTCIceCandidate using keyword args (fallback) for {client_id}")
-                 except TypeError as te_kw:
-                     logger.error(f"Keyword RTCIceCandidate constructor also failed ({type(te_kw).__name__}: {te_kw}). Cannot create candidate.")
-                     # Log details from both attempts if keyword fails
-                     logger.error(f"Positional attempt error: {te_pos}")
-                     logger.error(f"Keyword attempt error: {te_kw}")
-                     return False
-                 except Exception as create_err_kw:
-                     logger.error(f"Unexpected error creating RTCIceCandidate with keyword args: {create_err_kw}")
-                     return False
-            except Exception as create_err_pos:
-                 logger.error(f"Unexpected error creating RTCIceCandidate with positional args: {create_err_pos}")
-                 return False
-            
-            # If we successfully created an ice_candidate object via either method:
+            # aiortc rejects candidates on a dead connection anyway
+            if (pc.signalingState == "closed" or pc.iceConnectionState in _DEAD_STATES
+                    or (_HAS_CONN_STATE and pc.connectionState in _DEAD_STATES)):
+                logger.debug("Ignoring ICE candidate for closed connection %s", client_id)
+                return False
+                
             if ice_candidate is None:
-                 logger.error("RTCIceCandidate object is None after attempting both methods. This should not happen.")
-                 return False
-                 
-            # Add the created candidate to the peer connection
-            await pc.addIceCandidate(ice_candidate)
-            logger.debug(f"Passed candidate object to pc.addIceCandidate for {client_id}")
+                logger.debug("Received end-of-candidates signal for %s", client_id)
+                
+            # Add the candidate to the peer connection
+            if not await self._add_ice_candidate_timed(client_id, pc, ice_candidate):
+                return False
+            logger.debug("Passed candidate object to pc.addIceCandidate for %s", client_id)
             return True
 
         except Exception as e:
-            # Log the specific exception type and message
-            logger.error(f"Error processing ICE candidate string for {client_id} ({type(e).__name__}): {e}")
-            import traceback
-            logger.error(traceback.format_exc()) # Log full traceback for parsing errors
+            # Full traceback at most once per second so misbehaving clients can't flood the log
+            now = time.monotonic()
+            if now - self._last_ice_traceback >= 1.0:
+                self._last_ice_traceback = now
+                logger.exception("Error processing ICE candidate for %s", client_id)
+            else:
+                logger.error("Error processing ICE candidate for %s (%s): %s", client_id, type(e).__name__, e)
             return False
             
+    async def _add_ice_candidate_timed(self, client_id, pc, ice_candidate):
+        """Add a candidate under the peer's lock with an adaptive timeout"""
+        mdns = ice_candidate is not None and (ice_candidate.host or "").endswith(".local")
+        if mdns:
+            timeout = _ICE_ADD_TIMEOUT_MDNS
+        else:
+            timeout = max(_ICE_ADD_TIMEOUT_MIN,
+                          _ICE_ADD_TIMEOUT_FACTOR * self._ice_add_ewma.get(client_id, _ICE_ADD_DEFAULT_LATENCY))
+        
+        async with self._ice_sem[client_id]:
+            start = time.monotonic()
+            try:
+                await asyncio.wait_for(pc.addIceCandidate(ice_candidate), timeout=timeout)
+                added = True
+            except asyncio.TimeoutError:
+                logger.warning("addIceCandidate timed out after %.2fs for %s", timeout, client_id)
+                added = False
+            elapsed = time.monotonic() - start
+            
+        # A timeout counts as the full timeout, so a slow peer's budget grows
+        # instead of every later add timing out too. The peer may have been
+        # closed during the await - don't resurrect its entry. mDNS lookups say
+        # nothing about the peer's usual latency, so they are left out.
+        if not mdns and client_id in self.peer_connections:
+            previous = self._ice_add_ewma.get(client_id)
+            self._ice_add_ewma[client_id] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+        return added
+            
     async def broadcast_frame(self, frame):
         """Send a frame to all connected peers with enhanced reliability"""
         if not self.tracks:
@@ -677,24 +872,37 @@ class WebRTCManager:
                         
             self._frame_counter = getattr(self, '_frame_counter', 0) + 1
                 
-            # Update all tracks
-            updated = 0
+            # Collect the tracks of live connections
+            live_tracks = []
             closed_connections = []
             
             for client_id, track in list(self.tracks.items()):
-                try:
-                    # Verify connection is still active
-                    if client_id in self.peer_connections:
-                        pc = self.peer_connections[client_id]
-                        if pc.connectionState != "closed" and pc.connectionState != "failed":
-                            track.update_frame(frame)
-                            updated += 1
-                        else:
-                            # Mark for cleanup
-                            closed_connections.append(client_id)
+                # Verify connection is still active
+                pc = self.peer_connections.get(client_id)
+                if pc is not None:
+                    conn_state = pc.connectionState if _HAS_CONN_STATE else pc.iceConnectionState
+                    if conn_state not in _DEAD_STATES:
+                        live_tracks.append((client_id, track))
                     else:
-                        # Track exists but connection doesn't - clean up
+                        # Mark for cleanup
                         closed_connections.append(client_id)
+                else:
+                    # Track exists but connection doesn't - clean up
+                    closed_connections.append(client_id)
+            
+            # Transform off the event loop, then queue on it (asyncio queues aren't thread-safe)
+            updated = 0
+            if live_tracks:
+                processed = await asyncio.get_running_loop().run_in_executor(
+                    self._preproc_executor, self._prepare_frames, frame, live_tracks
+                )
+            else:
+                processed = []
+            
+            for (client_id, track), processed_frame in zip(live_tracks, processed):
+                try:
+                    track.push_frame(processed_frame)
+                    updated += 1
                 except Exception as e:
                     logger.error(f"Error updating track for {client_id}: {e}")
                     # If error occurs multiple times, mark for cleanup
@@ -708,7 +916,7 @@ class WebRTCManager:
             
             # Clean up closed connections
             for client_id in closed_connections:
-                logger.info(f"Scheduling cleanup for connection {client_id}")
+                logger.info("Scheduling cleanup for connection %s", client_id)
                 # Schedule cleanup to avoid blocking
                 asyncio.create_task(self.close_connection(client_id))
                     
@@ -718,14 +926,41 @@ class WebRTCManager:
             logger.error(f"Error broadcasting frame: {e}")
             return 0
             
+    def _get_frame_transformer(self, width, height):
+        """Return the transformer shared by all tracks of this size"""
+        transformer = self._frame_transformers.get((width, height))
+        if transformer is None:
+            transformer = FrameTransformer(width, height, num_buffers=3, use_opencl=self._use_opencl)
+            self._frame_transformers[(width, height)] = transformer
+        return transformer
+        
+    @staticmethod
+    def _prepare_frames(frame, live_tracks):
+        """
+        Run the frame transforms; executes on the preprocessing thread.
+        
+        Tracks sharing a transformer share its output, so each frame is scaled
+        and converted once per output size rather than once per peer.
+        """
+        outputs = {}
+        processed = []
+        for _, track in live_tracks:
+            transformer = track.frame_transformer
+            result = outputs.get(id(transformer))
+            if result is None:
+                result = outputs[id(transformer)] = transformer.transform(frame)
+            processed.append(result)
+        return processed
+        
     async def close_connection(self, client_id):
         """Close a peer connection"""
         try:
-            if client_id not in self.peer_connections:
+            pc = self.peer_connections.get(client_id)
+            if pc is None:
                 return False
                 
-            pc = self.peer_connections[client_id]
-            logger.info(f"Closing connection for {client_id}")
+            logger.info("Closing connection for %s", client_id)
+            self._pending_candidates.pop(client_id, None)
             
             # Close peer connection
             await pc.close()
@@ -733,6 +968,10 @@ class WebRTCManager:
             # Remove from tracking
             if client_id in self.tracks:
                 del self.tracks[client_id]
+            self._ice_sem.pop(client_id, None)
+            self._ice_add_ewma.pop(client_id, None)
+            self._forget_conn_state(client_id)
+            self._alive_peer_ids.discard(client_id)
                 
             if client_id in self.peer_connections:
                 del self.peer_connections[client_id]
@@ -749,6 +988,10 @@ class WebRTCManager:
             # Force cleanup
             if client_id in self.tracks:
                 del self.tracks[client_id]
+            self._ice_sem.pop(client_id, None)
+            self._ice_add_ewma.pop(client_id, None)
+            self._forget_conn_state(client_id)
+            self._alive_peer_ids.discard(client_id)
             if client_id in self.peer_connections:
                 del self.peer_connections[client_id]
                 
@@ -757,8 +1000,15 @@ class WebRTCManager:
     async def close_all_connections(self):
         """Close all peer connections"""
         client_ids = list(self.peer_connections.keys())
-        for client_id in client_ids:
-            await self.close_connection(client_id)
+        # Teardown is latency-bound, so close them concurrently; one failure
+        # mustn't stop the others
+        results = await asyncio.gather(
+            *(self.close_connection(client_id) for client_id in client_ids),
+            return_exceptions=True
+        )
+        for client_id, result in zip(client_ids, results):
+            if isinstance(result, Exception):
+                logger.error("Error closing connection for %s: %s", client_id, result)
             
         logger.info("All WebRTC connections closed")
         
@@ -766,19 +1016,25 @@ class WebRTCManager:
         """Get statistics about connections"""
         self.stats["active_connections"] = len(self.peer_connections)
         
-        # Collect connection states
+        # Collect connection states from the event-maintained cache
+        peers = {}
         states = {}
-        for client_id, pc in self.peer_connections.items():
-            state = pc.connectionState
+        for client_id in self._alive_peer_ids:
+            info = self._conn_state_cache[client_id]
+            peers[client_id] = info.as_dict()
+            state = info.conn
             if state not in states:
                 states[state] = 0
             states[state] += 1
             
         return {
             "connections": self.stats["active_connections"],
+            "connected": self._connected_count,
             "created_total": self.stats["created_connections"],
             "closed_total": self.stats["closed_connections"],
             "states": states,
+            "peers": peers,
             "video_config": self.video_config,
+            "environment_variables": self._env_vars_snapshot,
             "timestamp": time.time()
         }
\ No newline at end of file
@@ -7,6 +7,7 @@ import logging
 
 from core.state import app_state
 from core.config import config
+from network.ws_manager import unpack_client_message
 
 logger = logging.getLogger('network')
 
@@ -72,7 +73,15 @@ async def send_welcome_message(websocket, client_id):
 async def process_message(websocket, message, client_info):
     """Process an incoming WebSocket message with improved routing"""
     try:
-        data = json.loads(message)
+        if isinstance(message, bytes) and not message.startswith(b"{"):
+            # Binary MessagePack frame (e.g. load_pose_smpl with float32 arrays)
+            try:
+                data = unpack_client_message(message)
+            except Exception as e:
+                logger.warning(f"Dropping undecodable binary message from {client_info}: {e}")
+                return
+        else:
+            data = json.loads(message)
         message_type = data.get("type", "")
         
         # Route to appropriate handler based on message type
@@ -84,13 +93,15 @@ async def process_message(websocket, message, client_info):
             await handle_ping(websocket)
         elif message_type == "set_video_quality":
             await handle_video_quality(websocket, data)
+        elif message_type == "set_encoding":
+            await handle_set_encoding(websocket, data)
         elif message_type == "ice_candidate" or message_type == "webrtc_ice":
             # Import here to avoid circular imports
             from network.webrtc_handlers import handle_ice_candidate
             await handle_ice_candidate(websocket, data)
         else:
-            # Handle all other message types through message handler
-            await app_state.message_handler.handle_message(websocket, message)
+            # Handle all other message types through message handler (already parsed)
+            await app_state.message_handler.handle_message(websocket, data)
             
     except json.JSONDecodeError:
         # Handle non-JSON messages through message handler
@@ -103,6 +114,28 @@ async def handle_ping(websocket):
         "timestamp": datetime.now().isoformat()
     }))
 
+async def handle_set_encoding(websocket, data):
+    """
+    Let a client opt into MessagePack binary broadcast frames ("msgpack"), JSON
+    in binary frames ("json-bytes") or back to JSON text ("json"), and into
+    receiving backed-up broadcasts as "batch" frames.
+    """
+    encoding = data.get("encoding", "json")
+    batch = bool(data.get("batch", False))
+    success = app_state.ws_manager.set_client_encoding(websocket, encoding)
+    if success:
+        app_state.ws_manager.set_client_batching(websocket, batch)
+    else:
+        # Rejected request - leave the client's framing exactly as it was
+        logger.warning(f"Unsupported broadcast encoding '{encoding}' requested")
+    await websocket.send(json.dumps({
+        "type": "encoding_changed",
+        "encoding": encoding,
+        "batch": batch,
+        "success": success,
+        "timestamp": datetime.now().isoformat()
+    }))
+
 async def handle_video_quality(websocket, data):
     """Handle video quality change requests"""
     client_id = data.get("client_id")
@@ -152,8 +185,12 @@ async def handle_client_disconnect(websocket, client_info):
     
     # Clean up WebRTC connections
     try:
-        client_ip = websocket.remote_address[0] if hasattr(websocket, 'remote_address') else None
-        if client_ip and hasattr(app_state, 'webrtc_manager') and app_state.webrtc_manager:
+        # Use the IP cached at add_client time; if the client was already removed
+        # (stale-client sweep, failed send) fall back to the socket's address
+        client_ip = app_state.ws_manager.get_client_ip(websocket)
+        if client_ip is None and hasattr(websocket, 'remote_address') and websocket.remote_address:
+            client_ip = websocket.remote_address[0]
+        if client_ip and client_ip != "unknown" and hasattr(app_state, 'webrtc_manager') and app_state.webrtc_manager:
             # Check all current WebRTC connections and close matching ones
             for client_id in list(app_state.webrtc_manager.peer_connections.keys()):
                 # Check if client ID contains the IP address (our naming convention)
@@ -1,12 +1,153 @@
 import asyncio
+import dataclasses
 import json
 import logging
+import numpy as np
 import websockets
-from typing import Set, Dict, Any, Optional, List
+from typing import Set, Dict, Any, Optional, List, Union
 import time
 
+try:
+    import orjson
+except ImportError:  # optional speedup - fall back to the stdlib encoder
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # binary frames are only offered when msgpack is installed
+    msgpack = None
+
 logger = logging.getLogger('network')
 
+# Outbound messages buffered per client; when full the oldest is dropped
+CLIENT_QUEUE_SIZE = 64
+# A client that had this many broadcasts in a row dropped is considered stalled and closed
+MAX_CONSECUTIVE_DROPS = 256
+# Most queued messages coalesced into one frame for clients that accept batches
+MAX_BATCH_MESSAGES = 16
+# Array dtypes a client may use for raw little-endian array fields in MessagePack frames
+CLIENT_ARRAY_DTYPES = {"float16": "<f2", "float32": "<f4", "float64": "<f8"}
+# Payloads with at least this many values are encoded in a worker thread. The
+# encoder holds the GIL, so this doesn't let the loop run alongside it - it only
+# splits a very long encode into switch-interval slices. Pose frames (~2 KB)
+# stay well below it and encode inline.
+OFFLOAD_ENCODE_MIN_ITEMS = 4096
+
+def dumps(message: Any) -> str:
+    """
+    Encode a message as compact JSON text.
+    
+    Uses orjson when installed (NumPy arrays are serialized natively). The
+    result is decoded to ``str`` so it still goes out as a text frame, which is
+    what the browser clients parse.
+    """
+    if orjson is not None:
+        return orjson.dumps(message, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    return json.dumps(message, separators=(",", ":"))
+
+def _approx_items(payload: Dict[str, Any]) -> int:
+    """Rough size of a message: top-level fields, counting each list/dict by its length"""
+    return sum(len(v) if isinstance(v, (list, tuple, dict)) else 1 for v in payload.values())
+
+async def dumps_off_loop(message: Any) -> str:
+    """dumps(), moved to a worker thread for very large messages (see OFFLOAD_ENCODE_MIN_ITEMS)"""
+    if isinstance(message, dict) and _approx_items(message) >= OFFLOAD_ENCODE_MIN_ITEMS:
+        return await asyncio.to_thread(dumps, message)
+    return dumps(message)
+
+def _msgpack_array_header(length: int) -> bytes:
+    if length < 16:
+        return bytes((0x90 | length,))
+    return b"\xdc" + length.to_bytes(2, "big")
+
+def coalesce(messages: List[Union[str, bytes]], json_bytes: bool = False) -> List[Union[str, bytes]]:
+    """
+    Merge already-encoded messages into a single {"type": "batch", "messages": [...]} frame.
+    
+    The encoded payloads are spliced in as-is (JSON text into a JSON array,
+    MessagePack objects after a MessagePack array header), so nothing is
+    decoded or re-encoded. Binary messages are taken to be MessagePack unless
+    ``json_bytes`` says they are UTF-8 JSON. A mix of text and binary messages
+    can't share a frame and is returned unchanged.
+    """
+    if len(messages) < 2:
+        return messages
+    if all(isinstance(m, str) for m in messages):
+        return ['{"type":"batch","messages":[' + ",".join(messages) + "]}"]
+    if json_bytes and all(isinstance(m, bytes) for m in messages):
+        return [b'{"type":"batch","messages":[' + b",".join(messages) + b"]}"]
+    if msgpack is not None and all(isinstance(m, bytes) for m in messages):
+        header = b"\x82" + msgpack.packb("type") + msgpack.packb("batch") + msgpack.packb("messages")
+        return [header + _msgpack_array_header(len(messages)) + b"".join(messages)]
+    return messages
+
+def unpack_client_message(data: bytes) -> Dict[str, Any]:
+    """
+    Decode a MessagePack frame sent by a client.
+    
+    A bytes field "x" accompanied by "x_dtype" (one of CLIENT_ARRAY_DTYPES) is
+    raw little-endian array data and is returned as a float64 NumPy array, the
+    same values handlers would get from the JSON lists.
+    
+    Raises:
+        ValueError: If msgpack isn't installed or the frame isn't a MessagePack map
+    """
+    if msgpack is None:
+        raise ValueError("Received a binary MessagePack frame but msgpack is not installed")
+    message = msgpack.unpackb(data)
+    if not isinstance(message, dict):
+        raise ValueError("MessagePack frame is not a map")
+    for key, value in message.items():
+        dtype = CLIENT_ARRAY_DTYPES.get(message.get(f"{key}_dtype"))
+        if isinstance(value, bytes) and dtype is not None:
+            message[key] = np.frombuffer(value, dtype=dtype).astype(np.float64)
+    return message
+
+@dataclasses.dataclass
+class CachedMessage:
+    """
+    A message dict that is JSON-encoded at most once.
+    
+    Share one instance between everything that sends the same payload so the
+    encoding cost is paid a single time. The payload must not be mutated after
+    the first ``encode()``.
+    """
+    payload: Dict[str, Any]
+    # Fields replaced in the MessagePack encoding only, e.g. quantized arrays as raw bytes
+    binary_overrides: Optional[Dict[str, Any]] = None
+    _encoded: Optional[str] = dataclasses.field(default=None, repr=False)
+    _encoded_bytes: Optional[bytes] = dataclasses.field(default=None, repr=False)
+    _packed: Optional[bytes] = dataclasses.field(default=None, repr=False)
+    
+    def encode(self) -> str:
+        if self._encoded is None:
+            self._encoded = dumps(self.payload)
+        return self._encoded
+    
+    def encode_bytes(self) -> bytes:
+        """UTF-8 JSON for clients that take JSON in binary frames (no str round trip with orjson)"""
+        if self._encoded_bytes is None:
+            if orjson is not None and self._encoded is None:
+                self._encoded_bytes = orjson.dumps(self.payload, option=orjson.OPT_SERIALIZE_NUMPY)
+            else:
+                self._encoded_bytes = self.encode().encode()
+        return self._encoded_bytes
+    
+    async def encode_off_loop(self) -> str:
+        """encode(), run in a worker thread for very large payloads (see OFFLOAD_ENCODE_MIN_ITEMS)"""
+        if self._encoded is None and _approx_items(self.payload) >= OFFLOAD_ENCODE_MIN_ITEMS:
+            return await asyncio.to_thread(self.encode)
+        return self.encode()
+    
+    def pack(self) -> bytes:
+        """MessagePack encoding (floats as float32) for clients that opted into binary frames"""
+        if self._packed is None:
+            payload = self.payload
+            if self.binary_overrides:
+                payload = {**payload, **self.binary_overrides}
+            self._packed = msgpack.packb(payload, use_single_float=True)
+        return self._packed
+
 class WebSocketManager:
     """WebSocket connection manager for broadcasting messages to clients"""
     
@@ -14,10 +155,26 @@ class WebSocketManager:
         """Initialize the WebSocket manager"""
         self.connected_clients: Set[websockets.WebSocketServerProtocol] = set()
         # Track clients by IP address to detect duplicates
-        self.client_connections: Dict[str, List[websockets.WebSocketServerProtocol]] = {}
+        self.client_connections: Dict[str, Set[websockets.WebSocketServerProtocol]] = {}
+        # IP each client was registered under, so removal doesn't depend on the
+        # (possibly already torn down) socket still reporting its address
+        self._client_ips: Dict[websockets.WebSocketServerProtocol, str] = {}
         # Track recently sent message IDs to prevent echo
         self.recent_message_ids = set()
         self.max_message_ids = 1000
+        # Per-client outbound queue and the task draining it, so a slow client
+        # only ever delays itself
+        self._send_queues: Dict[websockets.WebSocketServerProtocol, asyncio.Queue] = {}
+        self._sender_tasks: Dict[websockets.WebSocketServerProtocol, asyncio.Task] = {}
+        self._consecutive_drops: Dict[websockets.WebSocketServerProtocol, int] = {}
+        # Clients that asked for MessagePack binary frames instead of JSON text
+        self._binary_clients: Set[websockets.WebSocketServerProtocol] = set()
+        # Clients that take the JSON encoding as UTF-8 in binary frames, so the
+        # bytes are produced once per broadcast instead of once per send
+        self._json_bytes_clients: Set[websockets.WebSocketServerProtocol] = set()
+        # Clients that accept several queued broadcasts coalesced into one "batch" frame
+        self._batching_clients: Set[websockets.WebSocketServerProtocol] = set()
+        self.dropped_messages = 0
         logger.debug("WebSocket manager initialized")
     
     def add_client(self, websocket):
@@ -29,9 +186,17 @@ class WebSocketManager:
         
         # Add to IP-based tracking
         if client_ip not in self.client_connections:
-            self.client_connections[client_ip] = []
+            self.client_connections[client_ip] = set()
+        
+        self.client_connections[client_ip].add(websocket)
+        self._client_ips[websocket] = client_ip
         
-        self.client_connections[client_ip].append(websocket)
+        # Start the client's outbound queue
+        if websocket not in self._send_queues:
+            queue = asyncio.Queue(maxsize=CLIENT_QUEUE_SIZE)
+            self._send_queues[websocket] = queue
+            self._consecutive_drops[websocket] = 0
+            self._sender_tasks[websocket] = asyncio.create_task(self._sender(websocket, queue))
         
         # Log connections from this IP
         if len(self.client_connections[client_ip]) > 1:
@@ -43,17 +208,82 @@ class WebSocketManager:
         """Remove a client from the manager"""
         self.connected_clients.discard(websocket)
         
-        # Also remove from IP-based tracking
-        client_ip = websocket.remote_address[0] if hasattr(websocket, 'remote_address') else "unknown"
+        # Stop its sender (unless we're being called from it)
+        self._binary_clients.discard(websocket)
+        self._json_bytes_clients.discard(websocket)
+        self._batching_clients.discard(websocket)
+        self._send_queues.pop(websocket, None)
+        self._consecutive_drops.pop(websocket, None)
+        task = self._sender_tasks.pop(websocket, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
         
-        if client_ip in self.client_connections:
-            if websocket in self.client_connections[client_ip]:
-                self.client_connections[client_ip].remove(websocket)
+        # Also remove from IP-based tracking
+        client_ip = self._client_ips.pop(websocket, None)
+        connections = self.client_connections.get(client_ip)
+        if connections is not None:
+            connections.discard(websocket)
             
             # Remove the IP entry if no more connections
-            if not self.client_connections[client_ip]:
+            if not connections:
                 del self.client_connections[client_ip]
     
+    def get_client_ip(self, websocket) -> Optional[str]:
+        """IP a client was registered under, without touching its transport"""
+        return self._client_ips.get(websocket)
+    
+    def set_client_encoding(self, websocket, encoding: str) -> bool:
+        """
+        Switch a client between "json" text frames, "json-bytes" (the same JSON
+        in binary frames) and "msgpack" binary frames.
+        """
+        if encoding == "msgpack":
+            if msgpack is None:
+                return False
+            self._json_bytes_clients.discard(websocket)
+            self._binary_clients.add(websocket)
+            return True
+        if encoding == "json-bytes":
+            self._binary_clients.discard(websocket)
+            self._json_bytes_clients.add(websocket)
+            return True
+        if encoding == "json":
+            self._binary_clients.discard(websocket)
+            self._json_bytes_clients.discard(websocket)
+            return True
+        return False
+    
+    def set_client_batching(self, websocket, enabled: bool) -> None:
+        """Let a client receive queued broadcasts coalesced into "batch" frames"""
+        if enabled:
+            self._batching_clients.add(websocket)
+        else:
+            self._batching_clients.discard(websocket)
+    
+    async def _sender(self, websocket, queue: asyncio.Queue) -> None:
+        """Drain one client's outbound queue"""
+        try:
+            while True:
+                message = await queue.get()
+                if queue.empty() or websocket not in self._batching_clients:
+                    await websocket.send(message)
+                    continue
+                    
+                # The client is behind - send everything that piled up in one frame
+                batch = [message]
+                while len(batch) < MAX_BATCH_MESSAGES and not queue.empty():
+                    batch.append(queue.get_nowait())
+                for frame in coalesce(batch, json_bytes=websocket in self._json_bytes_clients):
+                    await websocket.send(frame)
+        except asyncio.CancelledError:
+            pass
+        except websockets.exceptions.ConnectionClosed:
+            logger.debug(f"Client {getattr(websocket, 'remote_address', 'unknown')} closed during send")
+            self.remove_client(websocket)
+        except Exception as e:
+            logger.warning(f"Error sending message to client {getattr(websocket, 'remote_address', 'unknown')}: {e}")
+            self.remove_client(websocket)
+    
     async def send_to_client(self, websocket, message):
         """Send a message to a specific client"""
         if not websocket or (hasattr(websocket, 'closed') and websocket.closed):
@@ -61,8 +291,10 @@ class WebSocketManager:
             
         try:
             # Convert to JSON if it's not already a string
-            if not isinstance(message, str):
-                message = json.dumps(message)
+            if isinstance(message, CachedMessage):
+                message = message.encode()
+            elif not isinstance(message, str):
+                message = dumps(message)
                 
             await websocket.send(message)
             return True
@@ -70,12 +302,16 @@ class WebSocketManager:
             logger.warning(f"Error sending message to client: {str(e)}")
             return False
 
-    async def broadcast(self, message: Dict[Any, Any], originating_websocket: Optional[websockets.WebSocketServerProtocol] = None) -> None:
+    async def broadcast(self, message: Union[Dict[Any, Any], str, CachedMessage], originating_websocket: Optional[websockets.WebSocketServerProtocol] = None) -> None:
         """
-        Broadcast a message to all connected clients concurrently.
+        Broadcast a message to all connected clients.
+        
+        The message is encoded once and put on each client's bounded outbound
+        queue; per-client sender tasks do the actual writes.
         
         Args:
-            message: The message to broadcast, either a string or a dict that will be converted to JSON
+            message: The message to broadcast - a string, a dict that will be converted to JSON,
+                or a CachedMessage whose encoding is reused
             originating_websocket: The websocket that originated this message (to prevent echoes)
         """
         if not self.connected_clients:
@@ -83,6 +319,13 @@ class WebSocketManager:
             return
             
         try:
+            cached = message if isinstance(message, CachedMessage) else None
+            if cached is None and isinstance(message, dict) and (self._binary_clients or self._json_bytes_clients):
+                # Binary clients need a second encoding - cache both
+                cached = CachedMessage(message)
+            if cached is not None:
+                message = cached.payload
+                
             # Track message ID if available to prevent echo
             message_id = message.get("message_id", None) if isinstance(message, dict) else None
             
@@ -101,8 +344,10 @@ class WebSocketManager:
             # --- Measure Serialization Time --- Start
             serialization_start_time = time.monotonic()
             # Convert to JSON if it's not already a string
-            if not isinstance(message, str):
-                message_json = json.dumps(message)
+            if cached is not None:
+                message_json = await cached.encode_off_loop()
+            elif not isinstance(message, str):
+                message_json = await dumps_off_loop(message)
             else:
                 message_json = message # Already a string
             serialization_end_time = time.monotonic()
@@ -110,7 +355,7 @@ class WebSocketManager:
             # Log serialization time periodically or if it exceeds a threshold
             # Using simple periodic logging for now (e.g., every 60 calls ~ 1s at 60fps)
             # A counter could be added to the class if more precise periodic logging is needed
-            if message.get("type") == "smpl_update" and logger.isEnabledFor(logging.DEBUG): # Check level
+            if isinstance(message, dict) and message.get("type") == "smpl_update" and logger.isEnabledFor(logging.DEBUG): # Check level
                 if getattr(self, '_broadcast_count', 0) % 60 == 0:
                     logger.debug(f"JSON serialization took: {serialization_duration:.6f} seconds")
                 self._broadcast_count = getattr(self, '_broadcast_count', 0) + 1
@@ -119,76 +364,52 @@ class WebSocketManager:
             logger.error(f"Error serializing message: {str(e)}")
             return
 
-        # Prepare tasks for concurrent sending
-        tasks = []
+        # Queue the encoded message for every client, skipping the originator.
+        # Full queues drop their oldest message so slow clients fall behind alone.
+        # No lock or snapshot copy needed: nothing below awaits, so no other task
+        # can add/remove clients while we iterate, and stale clients are only
+        # removed after the loop.
         stale_connections = set()
-        valid_clients_for_broadcast = []
+        # JSON as bytes, produced on first use and shared by all json-bytes clients
+        message_bytes = None
 
-        for websocket in list(self.connected_clients):
+        for websocket, queue in self._send_queues.items():
             # Skip the originating websocket
             if originating_websocket and websocket == originating_websocket:
                 continue
 
             # Skip closed connections immediately
             if hasattr(websocket, 'closed') and websocket.closed:
-                 logger.debug("Skipping closed connection before creating task")
-                 stale_connections.add(websocket)
-                 continue
-            
-            # Add valid client and create send task
-            valid_clients_for_broadcast.append(websocket)
-            tasks.append(self._send_individual_message(websocket, message_json))
+                stale_connections.add(websocket)
+                continue
 
-        if not tasks:
-            logger.debug("No valid clients to broadcast to.")
-             # Still process any stale connections found
-            for ws in stale_connections:
-                 self.remove_client(ws)
-            return
+            if queue.full():
+                queue.get_nowait()
+                self.dropped_messages += 1
+                drops = self._consecutive_drops[websocket] + 1
+                self._consecutive_drops[websocket] = drops
+                if drops >= MAX_CONSECUTIVE_DROPS:
+                    logger.warning(f"Disconnecting stalled client {websocket.remote_address} after {drops} dropped messages")
+                    stale_connections.add(websocket)
+                    asyncio.create_task(websocket.close(code=1013, reason="Client too slow"))
+                    continue
+            else:
+                self._consecutive_drops[websocket] = 0
 
-        # Run tasks concurrently and gather results
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # Process results and identify failures/stale connections
-        success_count = 0
-        failed_count = 0
-        for i, result in enumerate(results):
-            client_ws = valid_clients_for_broadcast[i] # Get corresponding websocket
-            if isinstance(result, Exception):
-                logger.warning(f"Error sending message to client {client_ws.remote_address}: {result}")
-                stale_connections.add(client_ws)
-                failed_count += 1
-            elif result is False: # Our helper function returns False on specific non-exception errors
-                # This case might be redundant if _send_individual_message raises exceptions for failures
-                 logger.warning(f"Failed to send to client {client_ws.remote_address} (reported by send function)")
-                 stale_connections.add(client_ws)
-                 failed_count += 1
+            if cached is not None and websocket in self._binary_clients:
+                queue.put_nowait(cached.pack())
+            elif websocket in self._json_bytes_clients:
+                if message_bytes is None:
+                    message_bytes = cached.encode_bytes() if cached is not None else message_json.encode()
+                queue.put_nowait(message_bytes)
             else:
-                success_count += 1
+                queue.put_nowait(message_json)
 
-        # Remove stale connections identified during broadcast or pre-check
+        # Remove stale connections identified while queueing
         if stale_connections:
-             logger.info(f"Removing {len(stale_connections)} stale connections identified during broadcast.")
-             for ws in stale_connections:
-                 self.remove_client(ws)
-
-        if failed_count > 0:
-            logger.info(f"Broadcast complete - {success_count} succeeded, {failed_count} failed")
-        # else: # Optional: Log success only if needed
-        #     logger.debug(f"Broadcast complete - {success_count} succeeded")
-
-    async def _send_individual_message(self, websocket: websockets.WebSocketServerProtocol, message: str) -> bool:
-        """Helper coroutine to send a message to one client, handling exceptions."""
-        try:
-             # Re-check closed status just before sending, though unlikely to change
-             if hasattr(websocket, 'closed') and websocket.closed:
-                  # Raise exception to be caught by gather
-                  raise websockets.exceptions.ConnectionClosedOK(1000, "Client connection closed before send")
-             await websocket.send(message)
-             return True
-        except Exception as e:
-             # Raise the exception so asyncio.gather captures it
-             raise e
+            logger.info(f"Removing {len(stale_connections)} stale connections identified during broadcast.")
+            for ws in stale_connections:
+                self.remove_client(ws)
 
     def get_stats(self) -> Dict[str, Any]:
         """
@@ -206,5 +427,6 @@ class WebSocketManager:
         return {
             "connected_clients": len(self.connected_clients),
             "unique_clients": unique_ips,
-            "connections_by_ip": connections_by_ip
+            "connections_by_ip": connections_by_ip,
+            "dropped_messages": self.dropped_messages
         }
\ No newline at end of file
@@ -66,24 +66,25 @@ class DisplayManager:
             if frame.dtype != np.uint8:
                 frame = (frame * 255).astype(np.uint8)
             
-            # Use the original frame directly with minimal processing
-            display_frame = frame.copy()
-            
             # The environment returns frames in RGB format
             # We need to convert to BGR for OpenCV display functions
-            if len(display_frame.shape) == 3 and display_frame.shape[2] == 3:
+            if len(frame.shape) == 3 and frame.shape[2] == 3:
                 # Debug log (first few frames)
                 if not hasattr(self, "_debug_count"):
                     self._debug_count = 0
                 
                 if self._debug_count < 3:
-                    print(f"Display frame before conversion: shape={display_frame.shape}, "
-                          f"dtype={display_frame.dtype}, min={display_frame.min()}, "
-                          f"max={display_frame.max()}")
+                    print(f"Display frame before conversion: shape={frame.shape}, "
+                          f"dtype={frame.dtype}, min={frame.min()}, "
+                          f"max={frame.max()}")
                     self._debug_count += 1
                 
-                # Convert from RGB to BGR for OpenCV display
-                display_frame = cv2.cvtColor(display_frame, cv2.COLOR_RGB2BGR)
+                # Convert from RGB to BGR for OpenCV display - cvtColor returns a new
+                # array, so the overlays below never touch the renderer's buffer
+                display_frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            else:
+                # Overlays are drawn in place, so work on our own copy
+                display_frame = frame.copy()
             
             # Add Q-value overlay with better visibility
             if q_percentage is not None:
@@ -164,15 +165,20 @@ class DisplayManager:
                     print(f"Failed to show frame, continuing in headless mode: {e}")
                     self.headless = True
             
-            # Create resized version for saving - use high quality interpolation
-            if display_frame.shape[0] != resize_dims[1] or display_frame.shape[1] != resize_dims[0]:
+            # Create resized version for saving/streaming. Lanczos has no SIMD path in OpenCV
+            # and its extra sharpness is lost after lossy encoding, so use area for
+            # downscales and bilinear for upscales
+            src_h, src_w = display_frame.shape[:2]
+            if src_h != resize_dims[1] or src_w != resize_dims[0]:
+                downscale = resize_dims[0] * resize_dims[1] < src_w * src_h
                 resized_frame = cv2.resize(
                     display_frame, 
                     resize_dims, 
-                    interpolation=cv2.INTER_LANCZOS4  # Use high quality interpolation
+                    interpolation=cv2.INTER_AREA if downscale else cv2.INTER_LINEAR
                 )
             else:
-                resized_frame = display_frame.copy()
+                # display_frame is already a private buffer
+                resized_frame = display_frame
             
             return resized_frame
             
@@ -2,8 +2,8 @@
 
 import pickle
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 import argparse
+from lib.rotations import rotvecs_to_euler_xyz
 
 SKEL_JOINTS= [
     "Pelvis",
@@ -33,16 +33,10 @@ SKEL_JOINTS= [
 ]
 
 
-def _get_euler_from_smpl_poses(smpl_poses, idx) -> np.ndarray:
-    rotvec = smpl_poses[:, idx*3:idx*3+3]
-    euler = []
-    for _f in range(rotvec.shape[0]):
-        rot = R.from_rotvec(
-            [rotvec[_f, 0], rotvec[_f, 1], rotvec[_f, 2]],
-        )
-        _euler = rot.as_euler("xyz", degrees=True)
-        euler.append([_euler[0], _euler[1], _euler[2]])
-    return np.vstack(euler)
+def _get_eulers_from_smpl_poses(smpl_poses) -> np.ndarray:
+    # Every joint of every frame in one call: (F, 72) -> (F, 24, 3)
+    num_frames = smpl_poses.shape[0]
+    return rotvecs_to_euler_xyz(smpl_poses.reshape(num_frames, -1, 3))
 
 def main_test(pkl_path: str) -> None:
     print(f"\nLoading pickle file from: {pkl_path}")
@@ -66,7 +60,9 @@ def main_test(pkl_path: str) -> None:
     bones_remap = None
 
     # 1. Write smpl_poses
-    smpl_poses = smpl_data["smpl_poses"]
+    # Visualization only needs single precision - one contiguous float32 copy up front
+    smpl_poses = np.ascontiguousarray(smpl_data["smpl_poses"], dtype=np.float32)
+    eulers = _get_eulers_from_smpl_poses(smpl_poses)
     for idx, name in enumerate(SKEL_JOINTS):
         order = "XYZ"
         if axes_order and name in axes_order:
@@ -76,7 +72,7 @@ def main_test(pkl_path: str) -> None:
             offset = pose_offset[name]
         if bones_remap and name in bones_remap:
             name = bones_remap[name]
-        euler = _get_euler_from_smpl_poses(smpl_poses, idx)
+        euler = eulers[:, idx]
 
 
 if __name__ == "__main__":
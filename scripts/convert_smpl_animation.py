@@ -2,8 +2,9 @@
 
 import pickle
 import numpy as np
-from scipy.spatial.transform import Rotation as R
 import argparse
+from lib.rotations import rotvecs_to_euler_xyz
+import sys
 
 ROOT_JOINT = "Root"
 SKEL_JOINTS = [
@@ -38,17 +39,32 @@ def _write_curve(
     data: np.ndarray,
     offset: float = 0.0,
 ) -> None:
-    data = np.squeeze(data)
-    for i in range(data.shape[0]):
-        key_value = data[i] + offset
-        print(f"Frame {i}: {key_value}")
+    data = np.squeeze(data) + offset
+    # Build the whole curve and write it once instead of one print per frame
+    sys.stdout.write("".join(f"Frame {i}: {value}\n" for i, value in enumerate(data)))
+
+
+def _save_curves(
+    out_file,
+    curves: np.ndarray,
+    header: str,
+    axes_order="XYZ",
+    offset=(0, 0, 0),
+) -> None:
+    # One (F, 3) block per joint, formatted by NumPy in C
+    np.savetxt(out_file, curves + np.asarray(offset), fmt="%.6f", header=f"{header} axes={axes_order}")
 
 
 def _anim_rotation(
     euler,
     axes_order="XYZ",
     offset=(0, 0, 0),
+    out_file=None,
+    name="",
 ) -> None:
+    if out_file is not None:
+        _save_curves(out_file, euler, f"joint={name} rotation", axes_order, offset)
+        return
     for idx, axe_name in enumerate(axes_order):
         print(f"\nRotation {axe_name}:")
         _write_curve(euler[:, idx], offset=offset[idx])
@@ -58,24 +74,23 @@ def _anim_translation(
     trans,
     axes_order="XYZ",
     offset=(0, 0, 0),
+    out_file=None,
+    name="",
 ) -> None:
+    if out_file is not None:
+        _save_curves(out_file, trans, f"joint={name} translation", axes_order, offset)
+        return
     for idx, axe_name in enumerate(axes_order):
         print(f"\nTranslation {axe_name}:")
         _write_curve(trans[:, idx], offset=offset[idx])
 
-def _get_euler_from_smpl_poses(smpl_poses, idx) -> np.ndarray:
-    rotvec = smpl_poses[:, idx * 3 : idx * 3 + 3]
-    euler = []
-    for _f in range(rotvec.shape[0]):
-        rot = R.from_rotvec(
-            [rotvec[_f, 0], rotvec[_f, 1], rotvec[_f, 2]],
-        )
-        _euler = rot.as_euler("xyz", degrees=True)
-        euler.append([_euler[0], _euler[1], _euler[2]])
-    return np.vstack(euler)
+def _get_eulers_from_smpl_poses(smpl_poses) -> np.ndarray:
+    # Every joint of every frame in one call: (F, 72) -> (F, 24, 3)
+    num_frames = smpl_poses.shape[0]
+    return rotvecs_to_euler_xyz(smpl_poses.reshape(num_frames, -1, 3))
 
 
-def main_test(pkl_path: str) -> None:
+def main_test(pkl_path: str, out_path: str = None, verbose: bool = False) -> None:
     scale: float = 1.0
     axes_order = (None,)
     pose_offset = (None,)
@@ -84,10 +99,25 @@ def main_test(pkl_path: str) -> None:
     with open(pkl_path, "rb") as pkl_file:
         smpl_data = pickle.load(pkl_file)
 
+    # Curves go to --out via np.savetxt; the per-frame printout is kept for
+    # debugging (--verbose) and when no output file is given
+    out_file = open(out_path, "w") if out_path else None
+    print_curves = verbose or out_file is None
+    try:
+        _write_animation(smpl_data, scale, axes_order, pose_offset, bones_remap, out_file, print_curves)
+    finally:
+        if out_file is not None:
+            out_file.close()
+
+
+def _write_animation(smpl_data, scale, axes_order, pose_offset, bones_remap, out_file, print_curves) -> None:
     # 1. Write smpl_poses
-    smpl_poses = smpl_data["smpl_poses"]
+    # Visualization only needs single precision - one contiguous float32 copy up front
+    smpl_poses = np.ascontiguousarray(smpl_data["smpl_poses"], dtype=np.float32)
+    eulers = _get_eulers_from_smpl_poses(smpl_poses)
     for idx, name in enumerate(SKEL_JOINTS):
-        print(f"\n=== Processing joint: {name} ===")
+        if print_curves:
+            print(f"\n=== Processing joint: {name} ===")
         order = "XYZ"
         if axes_order and name in axes_order:
             order = axes_order[name]
@@ -96,21 +126,32 @@ def main_test(pkl_path: str) -> None:
             offset = pose_offset[name]
         if bones_remap and name in bones_remap:
             name = bones_remap[name]
-        euler = _get_euler_from_smpl_poses(smpl_poses, idx)
-        _anim_rotation(euler)
+        euler = eulers[:, idx]
+        if out_file is not None:
+            _anim_rotation(euler, out_file=out_file, name=name)
+        if print_curves:
+            _anim_rotation(euler)
 
     # 2. Write smpl_trans to f_avg_root
-    print("\n=== Processing root translation ===")
-    smpl_trans = smpl_data["smpl_trans"] * scale
+    if print_curves:
+        print("\n=== Processing root translation ===")
+    smpl_trans = np.ascontiguousarray(smpl_data["smpl_trans"], dtype=np.float32) * scale
     name = ROOT_JOINT
     if bones_remap and name in bones_remap:
         name = bones_remap[name]
-    _anim_translation(smpl_trans)
+    if out_file is not None:
+        _anim_translation(smpl_trans, out_file=out_file, name=name)
+    if print_curves:
+        _anim_translation(smpl_trans)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Convert SMPL animation from pickle file.')
     parser.add_argument('pkl_path', type=str, help='Path to the SMPL pickle file')
+    parser.add_argument('--out', type=str, default=None,
+                      help='Write the curves to this text file (np.savetxt) instead of printing them')
+    parser.add_argument('--verbose', action='store_true',
+                      help='Also print every frame of every curve')
     args = parser.parse_args()
     
-    main_test(args.pkl_path)
\ No newline at end of file
+    main_test(args.pkl_path, out_path=args.out, verbose=args.verbose)
\ No newline at end of file
@@ -1,14 +1,38 @@
 # lib/api.py
 
+import json
 import requests
 import logging
+import numpy as np
 from typing import Dict, Any, List
 
+try:
+    import orjson
+except ImportError:  # optional - fall back to the stdlib encoder
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
+
+def _to_list(value):
+    """json.dumps fallback for NumPy arrays and scalars"""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encode_json(payload: Dict[str, Any]) -> bytes:
+    """Encode a request body; NumPy arrays are serialized directly (natively with orjson)"""
+    if orjson is not None:
+        # Non-contiguous arrays (e.g. broadcast views) fall through to _to_list
+        return orjson.dumps(payload, default=_to_list, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_to_list).encode()
+
 class APIClient:
     def __init__(self, base_url: str = "http://localhost:5002"):
         self.base_url = base_url.rstrip('/')
+        # Keep-alive connection pool shared by every request from this client
+        self.session = requests.Session()
         
     def add_config(self, 
                    title: str, 
@@ -23,7 +47,7 @@ class APIClient:
         
         Args:
             title: Name of the animation/configuration
-            data: Animation/pose data
+            data: Animation/pose data (may contain NumPy arrays)
             type: Type of configuration (default: "pose")
             thumbnail: Optional thumbnail URL
             cache_file_path: Optional path to cached file
@@ -32,16 +56,17 @@ class APIClient:
             Created configuration object
         """
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/conf",
-                json={
+                data=_encode_json({
                     "title": title,
                     "type": type,
                     "data": data,
                     "thumbnail": thumbnail,
                     "cache_file_path": cache_file_path,
                     "users": users,
-                }
+                }),
+                headers={"Content-Type": "application/json"}
             )
             response.raise_for_status()
             return response.json()
@@ -0,0 +1,120 @@
+# lib/rotations.py
+
+import math
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+try:
+    from numba import njit
+except ImportError:  # optional - fall back to scipy / NumPy
+    njit = None
+
+
+def _rotvecs_to_euler_xyz_scipy(rotvecs: np.ndarray) -> np.ndarray:
+    rot = R.from_rotvec(rotvecs.reshape(-1, 3))
+    return rot.as_euler("xyz", degrees=True).reshape(rotvecs.shape)
+
+
+def _rotvecs_to_euler_xyz_loop(rotvecs):
+    """
+    Axis-angle -> extrinsic "xyz" Euler angles in degrees, one rotation per row
+    of an (N, 3) array. Builds only the rotation matrix entries the Euler
+    extraction needs (Rodrigues' formula), matching scipy's as_euler("xyz").
+    """
+    out = np.empty((rotvecs.shape[0], 3), dtype=np.float64)
+    for i in range(rotvecs.shape[0]):
+        x = np.float64(rotvecs[i, 0])
+        y = np.float64(rotvecs[i, 1])
+        z = np.float64(rotvecs[i, 2])
+        theta2 = x * x + y * y + z * z
+        if theta2 < 1e-12:
+            # Taylor expansions of sin(t)/t and (1 - cos(t))/t^2
+            a = 1.0 - theta2 / 6.0
+            b = 0.5 - theta2 / 24.0
+        else:
+            theta = np.sqrt(theta2)
+            a = np.sin(theta) / theta
+            b = (1.0 - np.cos(theta)) / theta2
+
+        r00 = 1.0 - b * (y * y + z * z)
+        r10 = a * z + b * x * y
+        r20 = -a * y + b * x * z
+        r21 = a * x + b * y * z
+        r22 = 1.0 - b * (x * x + y * y)
+
+        pitch = math.asin(min(1.0, max(-1.0, -r20)))
+        # Tolerance on the angle, not the sine: asin flattens near +-1, so a sine
+        # tolerance would lock poses well away from +-90 degrees
+        if abs(abs(pitch) - math.pi / 2) >= 1e-7:
+            out[i, 0] = np.arctan2(r21, r22)
+            out[i, 1] = pitch
+            out[i, 2] = np.arctan2(r10, r00)
+        else:
+            # Gimbal lock - like scipy, put all of the rotation on the first axis
+            r11 = 1.0 - b * (x * x + z * z)
+            r12 = -a * x + b * y * z
+            out[i, 0] = np.arctan2(-r12, r11)
+            out[i, 1] = pitch
+            out[i, 2] = 0.0
+    return np.degrees(out)
+
+
+if njit is not None:
+    # No fastmath: relaxed float semantics would blur the gimbal-lock test
+    _rotvecs_to_euler_xyz_jit = njit(cache=True)(_rotvecs_to_euler_xyz_loop)
+
+
+def rotvecs_to_euler_xyz(rotvecs: np.ndarray) -> np.ndarray:
+    """
+    Convert axis-angle rotations (..., 3) to extrinsic "xyz" Euler angles in
+    degrees with the same shape, e.g. SMPL poses (F, 24, 3) -> (F, 24, 3).
+
+    Uses a compiled Rodrigues/atan2 kernel when numba is installed, and
+    scipy's Rotation otherwise.
+    """
+    rotvecs = np.asarray(rotvecs)
+    if njit is None:
+        return _rotvecs_to_euler_xyz_scipy(rotvecs)
+    flat = np.ascontiguousarray(rotvecs.reshape(-1, 3))
+    return _rotvecs_to_euler_xyz_jit(flat).reshape(rotvecs.shape)
+
+
+def _canonicalize_rotvecs_numpy(rotvecs: np.ndarray) -> np.ndarray:
+    angles = np.linalg.norm(rotvecs, axis=-1, keepdims=True)
+    wrapped = np.mod(angles + np.pi, 2 * np.pi) - np.pi
+    return rotvecs * (wrapped / np.maximum(angles, 1e-12))
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _canonicalize_rotvecs_jit(rotvecs):
+        out = np.empty(rotvecs.shape, dtype=rotvecs.dtype)
+        for i in range(rotvecs.shape[0]):
+            x = np.float64(rotvecs[i, 0])
+            y = np.float64(rotvecs[i, 1])
+            z = np.float64(rotvecs[i, 2])
+            angle = math.sqrt(x * x + y * y + z * z)
+            scale = 1.0
+            if angle > math.pi:
+                wrapped = (angle + math.pi) % (2.0 * math.pi) - math.pi
+                scale = wrapped / angle
+            out[i, 0] = x * scale
+            out[i, 1] = y * scale
+            out[i, 2] = z * scale
+        return out
+
+
+def canonicalize_rotvecs(rotvecs: np.ndarray) -> np.ndarray:
+    """
+    Wrap axis-angle rotations (N, 3) so each angle lies in [-pi, pi], giving the
+    same rotations as a scipy from_rotvec().as_rotvec() round trip. float32
+    input stays float32; anything else comes back as float64.
+
+    Uses a compiled kernel when numba is installed, NumPy otherwise.
+    """
+    rotvecs = np.asarray(rotvecs)
+    dtype = np.float32 if rotvecs.dtype == np.float32 else np.float64
+    if njit is None:
+        return _canonicalize_rotvecs_numpy(rotvecs.astype(dtype, copy=False))
+    return _canonicalize_rotvecs_jit(np.ascontiguousarray(rotvecs, dtype=dtype))
@@ -1,17 +1,97 @@
 import asyncio
 import websockets
+import atexit
+import functools
 import logging
+import logging.handlers
+import queue
+import threading
 import json
 import numpy as np
 import os
 import time
 from datetime import datetime
-from scipy.spatial.transform import Rotation as R
 from pathlib import Path
-from lib.api import APIClient
+from lib.api import APIClient, _to_list
+from lib.rotations import canonicalize_rotvecs
 import requests
 import argparse
 
+try:
+    import orjson
+except ImportError:  # optional speedup - fall back to the stdlib parser
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # without msgpack we stay on JSON text frames
+    msgpack = None
+
+try:
+    import uvloop
+except ImportError:  # optional faster event loop
+    uvloop = None
+
+
+def _unbatch(message):
+    """Return the messages carried by a (possibly "batch") server message"""
+    if isinstance(message, dict) and message.get('type') == 'batch':
+        return message.get('messages', [])
+    return [message]
+
+
+def _loads(data):
+    """Parse a message: MessagePack or UTF-8 JSON for binary frames, JSON (orjson when available) for text"""
+    if isinstance(data, bytes) and not data.startswith(b'{'):
+        message = msgpack.unpackb(data)
+        # Binary pose updates carry the rotvecs as raw float16 bytes
+        for item in _unbatch(message):
+            if isinstance(item, dict) and item.get('pose_dtype') == 'float16':
+                item['pose'] = np.frombuffer(item['pose'], dtype=np.float16).astype(np.float32)
+        return message
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _dumps(message):
+    """Encode an outgoing message: orjson bytes (NumPy arrays serialized natively) when available"""
+    if orjson is not None:
+        return orjson.dumps(message, default=_to_list, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(message, default=_to_list)
+
+
+async def ainput(prompt=""):
+    """
+    input() in a daemon thread, so the heartbeat and receive tasks keep running
+    while we wait. A daemon thread (rather than the default executor) means a
+    pending prompt doesn't keep the interpreter alive after Ctrl-C.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def _resolve(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _read():
+        result, error = None, None
+        try:
+            result = input(prompt)
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(_resolve, result, error)
+        except RuntimeError:
+            pass  # Loop already closed - nobody is waiting any more
+
+    threading.Thread(target=_read, name="ainput", daemon=True).start()
+    return await future
+
 # Configuration
 CONFIG = {
     'WS_URI': 'ws://51.159.163.145:8765',
@@ -24,11 +104,19 @@ CONFIG = {
     'TARGET_FPS': 30,  # FPS for database storage
     'FRAME_DELAY': 0.25,  # 1/DEFAULT_FPS
     'RESPONSE_TIMEOUT': 30,
-    'HEARTBEAT_INTERVAL': 10
+    'HEARTBEAT_INTERVAL': 10,
+    'UPLOAD_CONCURRENCY': 8,  # NPZ files uploaded at once from a folder
+    'BINARY_POSE_FRAMES': False  # Set once the server confirms it speaks MessagePack
 }
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)  # Changed from DEBUG to INFO
+# Log records are queued and written by a listener thread so the receive
+# loop never blocks on console output
+_log_queue = queue.SimpleQueue()
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])  # Changed from DEBUG to INFO
 logger = logging.getLogger(__name__)
 # Reduce websockets protocol logging even further
 logging.getLogger('websockets').setLevel(logging.WARNING)
@@ -52,50 +140,84 @@ def get_frame_indices(total_frames, fps):
     original_fps = CONFIG['TARGET_FPS']
     interval = original_fps / fps
     
-    # Generate frame indices
-    return [int(i * interval) for i in range(total_frames) if int(i * interval) < total_frames]
+    # Generate frame indices (truncated like int(), then drop any past the end)
+    indices = (np.arange(total_frames) * interval).astype(np.int64)
+    return indices[indices < total_frames]
 
-def convert_npz_to_smpl(npz_path):
-    """Convert NPZ animation data to SMPL format"""
+def convert_npz_to_smpl(npz_path, fps=None):
+    """
+    Convert NPZ animation data to SMPL format.
+    With fps, only the frames kept at that rate (see get_frame_indices) are converted.
+    """
     try:
-        # Load NPZ file
-        data = np.load(npz_path)
-        print(f"Loaded NPZ data: {data.files}")
-        poses = data['poses']
+        # Open the NPZ lazily - only the members read below are decompressed,
+        # and the archive is closed as soon as they are in memory
+        with np.load(npz_path, allow_pickle=False) as data:
+            logger.debug(f"Loaded NPZ data: {data.files}")
+            poses = data['poses']
+            file_trans = data['trans'] if 'trans' in data else None
         
-        # Initialize SMPL arrays
-        num_frames = poses.shape[0]
-        smpl_poses = np.zeros((num_frames, len(SKEL_JOINTS) * 3))
+        # Decimate before converting so dropped frames cost nothing
+        source_frames = poses.shape[0]
+        if fps is not None:
+            keep = get_frame_indices(source_frames, fps)
+            poses = poses[keep]
+            if file_trans is not None:
+                file_trans = file_trans[keep]
         
-        # Convert poses to SMPL format
-        for frame in range(num_frames):
-            frame_poses = poses[frame]
-            
-            # Convert rotation vectors to SMPL format
-            for joint_idx in range(len(SKEL_JOINTS)):
-                start_idx = joint_idx * 3
-                joint_rot = frame_poses[start_idx:start_idx + 3]
-                
-                # Convert to rotation vector format expected by SMPL
-                rot = R.from_rotvec(joint_rot)
-                smpl_rot = rot.as_rotvec()
-                
-                smpl_poses[frame, start_idx:start_idx + 3] = smpl_rot
+        # Canonicalize the rotation vectors (angle wrapped into [-pi, pi]) like a
+        # Rotation round trip would, without building any Rotation objects
+        num_frames = poses.shape[0]
+        joint_rots = poses[:, :len(SKEL_JOINTS) * 3].reshape(-1, 3)
+        smpl_poses = canonicalize_rotvecs(joint_rots).reshape(num_frames, -1)
         
-        # Default translation if not in NPZ
-        smpl_trans = np.array([[0.0, 0.0, 0.91437225]] * num_frames)
-        if 'trans' in data:
-            smpl_trans = data['trans']
+        # Default translation if not in NPZ - a read-only stride-0 view, one row
+        # of storage for every frame
+        if file_trans is not None:
+            smpl_trans = np.ascontiguousarray(file_trans)
+        else:
+            default_trans = np.array([0.0, 0.0, 0.91437225], dtype=smpl_poses.dtype)
+            smpl_trans = np.broadcast_to(default_trans, (num_frames, 3))
             
+        # Kept as arrays in the file's precision (SMPL NPZs are usually float32) -
+        # senders serialize one row at a time
         return {
-            'poses': smpl_poses.tolist(),
-            'trans': smpl_trans.tolist()
+            'poses': smpl_poses,
+            'trans': smpl_trans,
+            'fps': fps,  # None when every source frame is included
+            'source_frames': source_frames
         }
         
     except Exception as e:
         logger.error(f"Error converting NPZ to SMPL: {e}")
         return None
 
+@functools.lru_cache(maxsize=32)
+def _convert_npz_cached(npz_path, mtime_ns):
+    smpl_data = convert_npz_to_smpl(npz_path)
+    if smpl_data is None:
+        # Raise so failures aren't cached
+        raise ValueError(f"Could not convert {npz_path}")
+    return smpl_data
+
+def load_npz_as_smpl(npz_path):
+    """
+    Full-rate convert_npz_to_smpl, memoized on the file's path and modification
+    time so prefetching and streaming the same animation only converts it once.
+    The returned arrays are shared between callers and must not be modified.
+    """
+    try:
+        mtime_ns = os.stat(npz_path).st_mtime_ns
+        return _convert_npz_cached(os.path.abspath(npz_path), mtime_ns)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error loading NPZ animation: {e}")
+        return None
+
+@functools.lru_cache(maxsize=None)
+def get_api_client(api_url):
+    """One APIClient (and connection pool) per API URL, shared by all uploads"""
+    return APIClient(api_url)
+
 def prepare_animation_for_db(poses, trans):
     """Convert animation data to database format"""
     return {
@@ -117,8 +239,9 @@ async def parse_users_input(users_input):
 async def upload_npz_to_db(npz_path, users=None):
     """Convert NPZ file and upload to database"""
     try:
-        # Convert NPZ to SMPL format
-        smpl_data = convert_npz_to_smpl(npz_path)
+        # Convert NPZ to SMPL format (in a thread - keeps the loop serving the socket).
+        # Uncached: each file is uploaded once, so caching would only pin its arrays
+        smpl_data = await asyncio.to_thread(convert_npz_to_smpl, npz_path)
         if not smpl_data:
             logger.error("Failed to convert NPZ to SMPL format")
             return False
@@ -126,14 +249,14 @@ async def upload_npz_to_db(npz_path, users=None):
         # Get animation name from filename
         animation_name = Path(npz_path).stem
         
-        # Prepare data for database
+        # Prepare data for database (the API client serializes the arrays directly)
         db_data = prepare_animation_for_db(
             poses=smpl_data['poses'],
             trans=smpl_data['trans']
         )
         
         # Use APIClient to upload to database
-        api_client = APIClient(CONFIG['API_URL'])
+        api_client = get_api_client(CONFIG['API_URL'])
         result = await asyncio.to_thread(
             api_client.add_config, # Assuming add_config is synchronous
             title=animation_name,
@@ -153,25 +276,36 @@ async def upload_npz_to_db(npz_path, users=None):
         logger.error(f"Error uploading animation to database: {e}")
         return False
 
+def _list_npz_files(folder_path):
+    """NPZ files in a folder as os.DirEntry objects (name and full path, no extra stat calls)"""
+    with os.scandir(folder_path) as entries:
+        return [entry for entry in entries if entry.name.endswith('.npz') and entry.is_file()]
+
 async def upload_npz_folder_to_db(folder_path, users=None):
     """Upload all NPZ files in folder to database"""
     try:
-        npz_files = [f for f in os.listdir(folder_path) if f.endswith('.npz')]
+        npz_files = _list_npz_files(folder_path)
         if not npz_files:
             logger.info(f"No NPZ files found in folder: {folder_path}")
             return
             
         logger.info(f"Found {len(npz_files)} NPZ files to upload")
         
-        for npz_file in npz_files:
-            full_path = os.path.join(folder_path, npz_file)
-            logger.info(f"Processing: {npz_file}")
-            
-            success = await upload_npz_to_db(full_path, users)
-            if success:
-                logger.info(f"Successfully uploaded: {npz_file}")
-            else:
-                logger.error(f"Failed to upload: {npz_file}")
+        # Uploads are I/O bound (conversion and the POST run in threads), so a
+        # few run at once
+        semaphore = asyncio.Semaphore(CONFIG['UPLOAD_CONCURRENCY'])
+        
+        async def upload_one(npz_file):
+            async with semaphore:
+                logger.info(f"Processing: {npz_file.name}")
+                
+                success = await upload_npz_to_db(npz_file.path, users)
+                if success:
+                    logger.info(f"Successfully uploaded: {npz_file.name}")
+                else:
+                    logger.error(f"Failed to upload: {npz_file.name}")
+        
+        await asyncio.gather(*(upload_one(npz_file) for npz_file in npz_files))
             
     except Exception as e:
         logger.error(f"Error processing folder: {e}")
@@ -188,15 +322,25 @@ async def response_handler(websocket, stop_event):
                 # and immediately discard smpl_update messages
                 response = await asyncio.wait_for(websocket.recv(), timeout=0.1)
 
+                # JSON-in-binary pose updates get the same cheap prefix check
+                if isinstance(response, bytes) and response.startswith(b'{"type":"smpl_update"'):
+                    continue
+                # Binary frames are MessagePack/JSON broadcasts, batch frames carry several
+                # broadcasts - decode them and skip the pose updates
+                if isinstance(response, bytes) or response.startswith('{"type":"batch"'):
+                    for message in _unbatch(_loads(response)):
+                        if isinstance(message, dict) and message.get('type') != 'smpl_update':
+                            logger.debug(f"Response received: {message.get('type')}")
+                    continue
                 # Quick check if it's an smpl_update before parsing the full JSON
                 # Use faster check: check beginning of string
-                if response.startswith('{"type":"smpl_update"'):
+                elif response.startswith('{"type":"smpl_update"'):
                     # Skip processing for these messages - no logging here
                     continue # Skip further processing for these messages
 
                 # For all other message types, process normally
                 try:
-                    response_data = json.loads(response)
+                    response_data = _loads(response)
                     # Reduced logging level for non-critical responses
                     if response_data.get('type') != 'connection_established': # Avoid logging initial success message again
                          logger.debug(f"Response received: {response_data.get('type')}") # Log only in DEBUG mode
@@ -234,19 +378,62 @@ async def heartbeat(websocket, stop_event):
         logger.error(f"Heartbeat fatal error: {e}")
         stop_event.set()
 
-async def send_smpl_pose(websocket, poses, trans, frame_idx=0):
-    """Send a single SMPL pose frame to the websocket - non-blocking"""
-    try:
-        message = {
+# ISO date-time prefix of the current second, reformatted only when the second changes
+_timestamp_second = None
+_timestamp_prefix = b""
+
+def _iso_timestamp():
+    """Local time as ISO 8601 bytes with microseconds, like datetime.now().isoformat()"""
+    global _timestamp_second, _timestamp_prefix
+    now = time.time()
+    second = int(now)
+    if second != _timestamp_second:
+        _timestamp_second = second
+        _timestamp_prefix = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(second)).encode()
+    return b"%s.%06d" % (_timestamp_prefix, int((now - second) * 1e6))
+
+# The fields of a load_pose_smpl frame that never change, encoded once
+_POSE_FRAME_PREFIX = b'{"type":"load_pose_smpl","model":"smpl","inference_type":"goal","pose":'
+
+def _encode_pose_frame(pose, trans):
+    """Encode a load_pose_smpl frame, splicing the per-frame values into the static envelope"""
+    if CONFIG['BINARY_POSE_FRAMES']:
+        # MessagePack with the arrays as raw little-endian bytes: float16 for the
+        # rotvecs (angles within [-pi, pi], ~0.002 rad resolution), float32 for
+        # trans, whose absolute positions need the extra precision
+        return msgpack.packb({
             "type": "load_pose_smpl",
-            "pose": poses[frame_idx],
-            "trans": trans[frame_idx],
+            "pose": np.asarray(pose, dtype='<f2').tobytes(),
+            "pose_dtype": "float16",
+            "trans": np.asarray(trans, dtype='<f4').tobytes(),
+            "trans_dtype": "float32",
             "model": "smpl",
             "inference_type": "goal",
-            "timestamp": datetime.now().isoformat()
-        }
-        
-        await websocket.send(json.dumps(message))
+            "timestamp": _iso_timestamp().decode()
+        }, use_bin_type=True)
+    if orjson is None:
+        return _dumps({
+            "type": "load_pose_smpl",
+            "pose": pose,
+            "trans": trans,
+            "model": "smpl",
+            "inference_type": "goal",
+            "timestamp": _iso_timestamp().decode()
+        })
+    return b"".join((
+        _POSE_FRAME_PREFIX,
+        orjson.dumps(pose, option=orjson.OPT_SERIALIZE_NUMPY),
+        b',"trans":',
+        orjson.dumps(trans, option=orjson.OPT_SERIALIZE_NUMPY),
+        b',"timestamp":"',
+        _iso_timestamp(),
+        b'"}'
+    ))
+
+async def send_smpl_pose(websocket, poses, trans, frame_idx=0):
+    """Send a single SMPL pose frame to the websocket - non-blocking"""
+    try:
+        await websocket.send(_encode_pose_frame(poses[frame_idx], trans[frame_idx]))
         return True
         
     except Exception as e:
@@ -271,26 +458,19 @@ async def send_fake_smpl_pose(websocket):
     }
     
     logger.info("Sending fake SMPL pose...")
-    await websocket.send(json.dumps(message))
+    await websocket.send(_dumps(message))
     response = await websocket.recv()
     logger.info(f"Received response: {response}")
 
-async def send_npz_as_smpl(websocket, npz_path, stop_event):
-    """Convert and send NPZ animation with frame rate control - non-blocking approach"""
-    logger.info(f"Converting NPZ animation: {npz_path}")
-    
-    smpl_data = convert_npz_to_smpl(npz_path)
-    if not smpl_data:
-        logger.error("Failed to convert NPZ to SMPL format")
-        return
-        
-    poses = smpl_data['poses']
-    trans = smpl_data['trans']
-    
+async def send_npz_as_smpl(websocket, npz_path, stop_event, smpl_data=None):
+    """
+    Convert and send NPZ animation with frame rate control - non-blocking approach.
+    Pass smpl_data when the file was already converted (e.g. prefetched).
+    """
     # Get desired FPS from user
     while True:
         try:
-            fps_input = input(f"Enter desired frames per second (default: {CONFIG['DEFAULT_FPS']}): ").strip()
+            fps_input = (await ainput(f"Enter desired frames per second (default: {CONFIG['DEFAULT_FPS']}): ")).strip()
             fps = float(fps_input) if fps_input else CONFIG['DEFAULT_FPS']
             if fps > 0:
                 break
@@ -298,10 +478,24 @@ async def send_npz_as_smpl(websocket, npz_path, stop_event):
         except ValueError:
             print("Invalid input. Please enter a number")
     
-    # Calculate which frames to keep
-    frame_indices = get_frame_indices(len(poses), fps)
+    if smpl_data is None:
+        logger.info(f"Converting NPZ animation: {npz_path}")
+        # Load and convert off the event loop so heartbeat and receives keep running
+        smpl_data = await asyncio.to_thread(load_npz_as_smpl, npz_path)
+    if not smpl_data:
+        logger.error("Failed to convert NPZ to SMPL format")
+        return
+        
+    poses = smpl_data['poses']
+    trans = smpl_data['trans']
+    
+    # Calculate which frames to keep (already done if converted at this FPS)
+    if smpl_data['fps'] == fps:
+        frame_indices = np.arange(len(poses))
+    else:
+        frame_indices = get_frame_indices(len(poses), fps)
     
-    logger.info(f"Original frames: {len(poses)}")
+    logger.info(f"Original frames: {smpl_data['source_frames']}")
     logger.info(f"Reduced to {len(frame_indices)} frames at {fps} FPS")
     
     # Adjust frame delay based on FPS
@@ -325,6 +519,11 @@ async def send_npz_as_smpl(websocket, npz_path, stop_event):
         asyncio.sleep(5)  # Log after 5 seconds
     )
     
+    # Frames are scheduled against absolute deadlines so a slow send doesn't
+    # push every following frame back
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time() + frame_delay
+    
     try:
         for frame_idx in frame_indices:
             if stop_event.is_set():
@@ -343,9 +542,15 @@ async def send_npz_as_smpl(websocket, npz_path, stop_event):
                     dropped_frames += 1
                     logger.warning(f"Failed to send frame {frame_idx + 1}")
                 
-                # Calculate how long to sleep to maintain target FPS
+                # Sleep until this frame's deadline to hold the target FPS
                 elapsed = time.time() - frame_start
-                sleep_time = max(0, frame_delay - elapsed)
+                now = loop.time()
+                # More than a frame behind (e.g. after a stall): resync instead of
+                # bursting the backlog out back-to-back
+                if now - next_tick > frame_delay:
+                    next_tick = now
+                sleep_time = max(0, next_tick - now)
+                next_tick += frame_delay
                 
                 if elapsed > frame_delay:
                     logger.debug(f"Frame sending took {elapsed:.4f}s, exceeding frame delay of {frame_delay:.4f}s")
@@ -378,16 +583,16 @@ async def get_current_context(websocket):
     }
     
     logger.info("Requesting current context...")
-    await websocket.send(json.dumps(message))
+    await websocket.send(_dumps(message))
     
     while True:
         response = await websocket.recv()
         
         try:
-            context_data = json.loads(response)
+            context_data = _loads(response)
             
             # Skip SMPL updates
-            if isinstance(context_data, dict) and context_data.get("type") == "smpl_update":
+            if isinstance(context_data, dict) and context_data.get("type") in ("smpl_update", "batch"):
                 continue
                 
             logger.info("\n=== Current Context Information ===")
@@ -403,33 +608,49 @@ async def get_current_context(websocket):
             logger.error(f"Raw response: {response}")
             break
 
+async def _prefetch_npz(npz_paths, queue):
+    """Convert NPZ files in order in a worker thread, queueing (path, smpl_data) for the sender"""
+    for npz_path in npz_paths:
+        smpl_data = await asyncio.to_thread(load_npz_as_smpl, npz_path)
+        await queue.put((npz_path, smpl_data))
+
 async def load_npz_animation_folder(websocket, folder_path, stop_event):
     """Load and send animations from a folder of NPZ files"""
+    prefetch_task = None
     try:
-        npz_files = [f for f in os.listdir(folder_path) if f.endswith('.npz')]
+        npz_files = _list_npz_files(folder_path)
         if not npz_files:
             logger.info(f"No NPZ files found in folder: {folder_path}")
             return
             
         logger.info(f"Found {len(npz_files)} NPZ files in folder")
         
-        for npz_file in npz_files:
+        # Convert the next file(s) in the background while the current one streams
+        converted = asyncio.Queue(maxsize=2)
+        prefetch_task = asyncio.create_task(_prefetch_npz(
+            [npz_file.path for npz_file in npz_files], converted
+        ))
+        
+        for index, npz_file in enumerate(npz_files):
             if stop_event.is_set():
                 logger.info("Stopping folder processing due to connection issues")
                 return
 
-            full_path = os.path.join(folder_path, npz_file)
-            logger.info(f"Processing animation: {npz_file}")
+            full_path, smpl_data = await converted.get()
+            logger.info(f"Processing animation: {npz_file.name}")
             
-            await send_npz_as_smpl(websocket, full_path, stop_event)
+            await send_npz_as_smpl(websocket, full_path, stop_event, smpl_data=smpl_data)
             
-            if npz_file != npz_files[-1] and not stop_event.is_set():
-                input("Press Enter to load next animation...")
+            if index < len(npz_files) - 1 and not stop_event.is_set():
+                await ainput("Press Enter to load next animation...")
                 
     except FileNotFoundError:
         logger.error(f"Folder not found: {folder_path}")
     except Exception as e:
         logger.error(f"Error loading animations: {e}")
+    finally:
+        if prefetch_task is not None:
+            prefetch_task.cancel()
 
 async def trigger_webserver_ai_prompt(prompt=None):
     """Send HTTP POST request to trigger the general AI prompt on the webserver.
@@ -470,7 +691,7 @@ async def start_video_recording(websocket):
     }
     logger.info("Sending start video recording command...")
     try:
-        await websocket.send(json.dumps(message))
+        await websocket.send(_dumps(message))
         # Optionally wait for a response confirming start, but keep it simple for now
     except Exception as e:
         logger.error(f"Failed to send start video recording command: {e}")
@@ -483,7 +704,7 @@ async def stop_video_recording(websocket):
     }
     logger.info("Sending stop video recording command...")
     try:
-        await websocket.send(json.dumps(message))
+        await websocket.send(_dumps(message))
         # Optionally wait for confirmation
     except Exception as e:
         logger.error(f"Failed to send stop video recording command: {e}")
@@ -504,13 +725,26 @@ async def display_menu():
     
     while True:
         try:
-            choice = input("\nEnter your choice (1-10): ")
+            choice = await ainput("\nEnter your choice (1-10): ")
             if choice in [str(i) for i in range(1, 11)]:
                 return choice
             print("Invalid choice. Please enter a number between 1 and 10.")
         except ValueError:
             print("Invalid input. Please enter a number.")
 
+async def _wait_for_encoding_reply(websocket, timeout=5.0):
+    """Wait for the server's encoding_changed reply to set_encoding, skipping broadcasts"""
+    async def _recv_reply():
+        while True:
+            for message in _unbatch(_loads(await websocket.recv())):
+                if isinstance(message, dict) and message.get('type') == 'encoding_changed':
+                    return message
+    try:
+        return await asyncio.wait_for(_recv_reply(), timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning("No reply to set_encoding - sending pose frames as JSON")
+        return None
+
 async def establish_connection():
     """Establish WebSocket connection with proper error handling"""
     for retry in range(CONFIG['MAX_RETRIES']):
@@ -518,15 +752,31 @@ async def establish_connection():
             logger.info(f"Connecting to {CONFIG['WS_URI']}...")
             # Add query param to indicate this is a lightweight client
             uri = f"{CONFIG['WS_URI']}?client_type=lightweight"
-            websocket = await websockets.connect(uri)
+            # No permessage-deflate: pose frames are small and poorly compressible,
+            # so zlib on every send/recv costs more than it saves. Keepalive pings
+            # come from our own heartbeat task, so the library's are turned off.
+            websocket = await websockets.connect(uri, compression=None, ping_interval=None)
             
             # Wait for the initial connection message
             response = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-            response_data = json.loads(response)
-            print(response_data)
+            response_data = _loads(response)
+            logger.debug(response_data)
             
             if response_data.get('type') == 'connection_established':
                 logger.info("Connected successfully to simulation WebSocket!")
+                # Ask for binary broadcasts (MessagePack when available, otherwise JSON
+                # bytes the server encodes once for all clients), batched if we fall behind
+                await websocket.send(_dumps({
+                    "type": "set_encoding",
+                    "encoding": "msgpack" if msgpack is not None else "json-bytes",
+                    "batch": True
+                }))
+                # Pose frames go out as MessagePack only if the server could switch to it
+                reply = await _wait_for_encoding_reply(websocket)
+                CONFIG['BINARY_POSE_FRAMES'] = bool(
+                    msgpack is not None and reply
+                    and reply.get('encoding') == 'msgpack' and reply.get('success')
+                )
                 return websocket
             else:
                 logger.warning(f"Unexpected initial response: {response_data.get('type')}")
@@ -571,32 +821,32 @@ async def interactive_client():
                 elif choice == '2':
                     await get_current_context(websocket)
                 elif choice == '3':
-                    npz_path = input("\nEnter the path to the NPZ file: ").strip()
+                    npz_path = (await ainput("\nEnter the path to the NPZ file: ")).strip()
                     if npz_path:
                         await send_npz_as_smpl(websocket, npz_path, stop_event)
                 elif choice == '4':
-                    folder_path = input("\nEnter the path to the NPZ folder: ").strip()
+                    folder_path = (await ainput("\nEnter the path to the NPZ folder: ")).strip()
                     if folder_path:
                         await load_npz_animation_folder(websocket, folder_path, stop_event)
                 elif choice == '5':
-                    npz_path = input("\nEnter the path to the NPZ file: ").strip()
-                    users_input = input("\nEnter usernames (comma-separated) or leave empty: ").strip()
+                    npz_path = (await ainput("\nEnter the path to the NPZ file: ")).strip()
+                    users_input = (await ainput("\nEnter usernames (comma-separated) or leave empty: ")).strip()
                     users = await parse_users_input(users_input)
                     
                     if npz_path:
                         await upload_npz_to_db(npz_path, users)
                 elif choice == '6':
-                    folder_path = input("\nEnter the path to the NPZ folder: ").strip()
-                    users_input = input("\nEnter usernames (comma-separated) or leave empty: ").strip()
+                    folder_path = (await ainput("\nEnter the path to the NPZ folder: ")).strip()
+                    users_input = (await ainput("\nEnter usernames (comma-separated) or leave empty: ")).strip()
                     users = await parse_users_input(users_input)
                     
                     if folder_path:
                         await upload_npz_folder_to_db(folder_path, users)
                 elif choice == '7':
                     custom_prompt = None
-                    use_custom = input("Use a custom prompt? (y/N): ").strip().lower()
+                    use_custom = (await ainput("Use a custom prompt? (y/N): ")).strip().lower()
                     if use_custom == 'y':
-                        custom_prompt = input("Enter custom prompt text: ").strip()
+                        custom_prompt = (await ainput("Enter custom prompt text: ")).strip()
                         if not custom_prompt:
                             logger.warning("Empty custom prompt entered, using default.")
                             custom_prompt = None
@@ -611,7 +861,7 @@ async def interactive_client():
                     break
                 
                 if choice != '10' and not stop_event.is_set():
-                    input("\nPress Enter to continue...")
+                    await ainput("\nPress Enter to continue...")
                 
             except Exception as e:
                 logger.error(f"Operation error: {e}")
@@ -666,6 +916,8 @@ if __name__ == "__main__":
     # Ensure APIClient is correctly imported and available
     # If APIClient is not used for the POST, ensure 'requests' is installed
     # pip install requests
+    if uvloop is not None:
+        uvloop.install()
     try:
         asyncio.run(interactive_client())
     except KeyboardInterrupt: